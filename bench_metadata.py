@@ -0,0 +1,220 @@
+"""
+Compare the Polars metadata pipeline of get_metadata.py with the previous pandas implementation.
+
+The pandas run executes a copy of the original get_metadata.py code (process_json_files_pandas
+below), so it measures the original code rather than a re-implementation on top of the ingest
+module. Every run happens in a fresh interpreter, so the wall time includes the imports and the
+peak RSS is that of the run and its worker processes. Outputs are written to a temporary
+directory, nothing under DATA_DIR changes.
+
+    python bench_metadata.py            # prompts for the sub-directory, like the delivery scripts
+    python bench_metadata.py ALL 3      # sub-directory and number of repetitions
+"""
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from dotenv import load_dotenv
+
+IMPLEMENTATIONS = ["pandas", "polars", "polars (cached)"]
+
+# COLUMN_MAPPING of the original get_metadata.py
+PANDAS_COLUMN_MAPPING = {
+    'task id': 'task_id',
+    'trainer id': 'trainer_id',
+    'model name': 'model_name',
+    'question_id': 'question_id',
+    'level': 'level',
+    'ACC': 'acc',
+    'temperature': 'temperature',
+    'total_tokens': 'total_tokens',
+    'total_latency (ms)': 'total_latency_ms',
+    'abandon_prompt': 'abandon_prompt',
+    'abandon_prompt_reason': 'abandon_prompt_reason',
+    'intervention rounds': 'intervention_rounds',
+    'CoT quality': 'cot_quality',
+    'remarks': 'remarks',
+    'Model performance classification': 'model_performance_classification',
+    'codeforces_submission_id':'codeforces_submission_id',
+    'programming_language': 'programming_language',
+}
+
+
+def peak_rss_mb():
+    import resource
+    # Files are parsed in worker processes when there are several CPUs, so the largest of them counts too
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def process_json_files_pandas(data_dir):
+    """process_json_files of the original get_metadata.py, unchanged apart from the mapping name."""
+    all_processed_items = []
+    all_column_names = set(PANDAS_COLUMN_MAPPING.values()) # Start with mapped names
+
+    # Recursively find all .json and .jsonl files
+    json_files = glob.glob(os.path.join(data_dir, '**', '*.json'), recursive=True)
+    jsonl_files = glob.glob(os.path.join(data_dir, '**', '*.jsonl'), recursive=True)
+    all_input_files = json_files + jsonl_files
+
+    for file_path in all_input_files:
+        print(f"Processing file: {file_path}")
+        # Extract batch_id from filename
+        basename = os.path.basename(file_path)
+        batch_id = os.path.splitext(basename)[0]
+        
+        items = []
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                if file_path.endswith('.jsonl'):
+                    for line in f:
+                        try:
+                            items.append(json.loads(line))
+                        except json.JSONDecodeError as e_line:
+                            print(f"Skipping line in {file_path} due to JSON decode error: {e_line}")
+                elif file_path.endswith('.json'):
+                    try:
+                        content = json.load(f)
+                        if isinstance(content, list):
+                            items = content
+                        elif isinstance(content, dict): # Handle case where a .json file might contain a single object
+                            items = [content]
+                        else:
+                            print(f"Skipping file {file_path}: content is not a list or dict of JSON objects.")
+                    except json.JSONDecodeError as e_file:
+                        print(f"Skipping file {file_path} due to JSON decode error: {e_file}")
+                        # As a fallback for .json, try to read as JSONL if initial parse fails
+                        # This might happen if a .json file is actually in JSONL format
+                        f.seek(0) # Reset file pointer to the beginning
+                        try:
+                            print(f"Attempting to read {file_path} as JSONL...")
+                            current_items = []
+                            for line in f:
+                                try:
+                                    current_items.append(json.loads(line))
+                                except json.JSONDecodeError as e_line_fallback:
+                                    print(f"Skipping line in {file_path} (fallback JSONL) due to JSON decode error: {e_line_fallback}")
+                            items = current_items
+                        except Exception as e_fallback:
+                            print(f"Failed to read {file_path} as JSONL fallback: {e_fallback}")
+
+        except Exception as e:
+            print(f"Could not read or process file {file_path}: {e}")
+            continue
+
+        for item in items:
+            if not isinstance(item, dict):
+                print(f"Skipping non-dictionary item in {file_path}: {item}")
+                continue
+            
+            processed_item = {}
+            # Apply column mapping and collect all original column names
+            for original_key, value in item.items():
+                if original_key in PANDAS_COLUMN_MAPPING:
+                    new_key = PANDAS_COLUMN_MAPPING.get(original_key, original_key) # Use original key if not in mapping
+                    if 'id' in new_key:  # Convert any form of ID to string
+                        value = str(value)
+                    processed_item[new_key] = value
+                    all_column_names.add(new_key) # Add the key used (either mapped or original)
+            
+            # Add batch_id
+            processed_item['batch_id'] = batch_id
+            all_column_names.add('batch_id')
+            
+            all_processed_items.append(processed_item)
+
+    # No filter
+    filtered_items = all_processed_items
+
+    # Ensure all filtered items have all collected columns
+    final_output_items = []
+    for item in filtered_items:
+        standardized_item = {}
+        for col_name in all_column_names:
+            standardized_item[col_name] = item.get(col_name) # Defaults to None if key is missing
+        final_output_items.append(standardized_item)
+        
+    return final_output_items
+
+
+def run_pandas(file_dir, output_file_path):
+    # The body of the original main(), without the prompt
+    import pandas as pd
+
+    output_data = process_json_files_pandas(file_dir)
+    df = pd.DataFrame(output_data)
+    df = df[list(PANDAS_COLUMN_MAPPING.values()) + ['batch_id']]
+    df.to_csv(output_file_path, index=False, encoding='utf-8')
+
+
+def run_polars(file_dir, output_file_path, cache_dir):
+    from get_metadata import scan_metadata
+    from sinks import sink_frame
+
+    sink_frame(scan_metadata(file_dir, cache_dir=cache_dir), output_file_path, "csv")
+
+
+def run_child(name, file_dir, output_file_path, cache_dir):
+    """Entry point of a single measured run; prints "<seconds> <peak RSS in MB>"."""
+    start = time.perf_counter()
+    if name == "pandas":
+        run_pandas(file_dir, output_file_path)
+    else:
+        run_polars(file_dir, output_file_path, cache_dir or None)
+    print(f"{time.perf_counter() - start} {peak_rss_mb()}")
+
+
+def measure(name, file_dir, output_file_path, cache_dir=""):
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", name, file_dir, output_file_path, cache_dir],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    seconds, rss = result.stdout.strip().splitlines()[-1].split()
+    return float(seconds), float(rss)
+
+
+def main():
+    load_dotenv(override=True)
+    DATA_DIR = os.getenv('DATA_DIR', './data')
+
+    if not os.path.isdir(DATA_DIR):
+        raise ValueError(f"Error: Data directory '{DATA_DIR}' not found.")
+
+    SUB_DIR = sys.argv[1] if len(sys.argv) > 1 else input("Please enter the sub-directory for the delivery JSON files (e.g., ALL): ")
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    FILE_DIR = DATA_DIR + "/" + SUB_DIR
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_dir = os.path.join(tmp_dir, "cache")
+        # Fill the cache once, so "polars (cached)" measures re-runs over unchanged deliveries
+        measure("polars", FILE_DIR, os.path.join(tmp_dir, "warmup.csv"), cache_dir)
+
+        print(f"{'implementation':<18}{'best wall time (s)':>20}{'peak RSS (MB)':>16}")
+        for name in IMPLEMENTATIONS:
+            runs = [
+                measure(
+                    name.split()[0],
+                    FILE_DIR,
+                    os.path.join(tmp_dir, f"metadata-{i}.csv"),
+                    cache_dir if name == "polars (cached)" else "",
+                )
+                for i in range(repeat)
+            ]
+            print(f"{name:<18}{min(s for s, _ in runs):>20.2f}{max(r for _, r in runs):>16.0f}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        run_child(*sys.argv[2:6])
+    else:
+        main()
@@ -9,6 +9,35 @@ DATA_VALS = {
     "ground_truth_answer": "Ground Truth Answer",
 }
 
+COLUMN_MAPPING = {
+    "task id": "task_id",
+    "trainer id": "trainer_id",
+    "model name": "model_name",
+    "question_id": "question_id",
+    "system prompt": "system_prompt",
+    "user prompt": "user_prompt",
+    "level": "level",
+    "ACC": "acc",
+    "intervene_system_prompt": "intervene_system_prompt",
+    "intervene prompt": "intervene_prompt",
+    "ground_truth_answer": "ground_truth_answer",
+    "temperature": "temperature",
+    "total_tokens": "total_tokens",
+    "total_latency (ms)": "total_latency_ms",
+    "initial_reasoning": "initial_reasoning",
+    "response": "response",
+    # "initial_response": "initial_response",
+    "final_answer": "final_answer",
+    "abandon_prompt": "abandon_prompt",
+    "abandon_prompt_reason": "abandon_prompt_reason",
+    "intervention rounds": "intervention_rounds",
+    "CoT quality": "cot_quality",
+    "remarks": "remarks",
+    "Model performance classification": "model_performance_classification",
+    "codeforces_submission_id": "codeforces_submission_id",
+    "programming_language": "programming_language",
+}
+
 DATA_INFO = [
     "task id",
     "question_id",
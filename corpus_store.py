@@ -0,0 +1,130 @@
+import os
+from functools import partial
+
+import polars as pl
+from dotenv import load_dotenv
+
+from constants import COLUMN_MAPPING
+from ingest import find_input_files, get_batch_id, map_files, process_file_frame
+from manifest import config_key, hash_file, is_unchanged, load_manifest, make_entry, save_manifest
+from schemas import SCHEMA_VERSION
+from tags import extract_tag_spans
+from text_hash import HASHED_COLUMNS, hash_exprs
+
+# Bump when the partition layout changes, so existing stores are rebuilt
+STORE_VERSION = 4
+
+
+def build_partition(file_path, store_dir, manifest, column_mapping=COLUMN_MAPPING):
+    """Write one delivery file as a Parquet file in its batch_id partition, unless already stored."""
+    stat = os.stat(file_path)
+    entry = manifest.get(os.path.abspath(file_path))
+    if not (is_unchanged(entry, stat) and os.path.exists(os.path.join(store_dir, entry["output"]))):
+        content_hash = hash_file(file_path)
+        # The mapping, store and schema versions are part of the name, so changing any of them rebuilds every partition
+        output = os.path.join(
+            f"batch_id={get_batch_id(file_path)}",
+            f"{content_hash}-{config_key({'column_mapping': column_mapping, 'version': STORE_VERSION, 'schema': SCHEMA_VERSION})}.parquet",
+        )
+        entry = make_entry(stat, content_hash, output)
+
+    output_path = os.path.join(store_dir, entry["output"])
+    if os.path.exists(output_path):
+        return entry, False
+
+    # Typed like the ingest cache (schemas.FIELD_TYPES); missing ids stay null instead of becoming "None"
+    frame = process_file_frame(file_path, column_mapping)
+    if "response" in frame.columns:
+        frame = extract_tag_spans(frame, "response")
+    # Content hashes of the prompt and response, so duplicates can be found without reading the texts
+    frame = frame.with_columns(hash_exprs({column: name for column, name in HASHED_COLUMNS.items() if column in frame.columns}))
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    frame.write_parquet(tmp_path)
+    os.replace(tmp_path, output_path)
+    return entry, True
+
+
+def prune_store(store_dir, manifest):
+    """Remove partition files that no longer belong to any delivery file, and empty partitions."""
+    referenced = {os.path.normpath(entry["output"]) for entry in manifest.values()}
+    for root, _, files in os.walk(store_dir, topdown=False):
+        for name in files:
+            rel_path = os.path.normpath(os.path.relpath(os.path.join(root, name), store_dir))
+            if name.endswith(".parquet") and rel_path not in referenced:
+                os.remove(os.path.join(root, name))
+        if root != store_dir and not os.listdir(root):
+            os.rmdir(root)
+
+
+def build_corpus_store(data_dir, store_dir, workers=None):
+    """
+    Convert the delivery tree under data_dir into a Parquet dataset partitioned by batch_id.
+
+    Only files that are new or changed since the last build are converted.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    manifest = load_manifest(store_dir)
+    input_files = find_input_files(data_dir)
+    func = partial(build_partition, store_dir=store_dir, manifest=manifest)
+
+    new_manifest = {}
+    built = 0
+    for file_path, (entry, was_built) in map_files(func, input_files, workers):
+        new_manifest[os.path.abspath(file_path)] = entry
+        if was_built:
+            built += 1
+            print(f"Stored file: {file_path}")
+
+    save_manifest(store_dir, new_manifest)
+    prune_store(store_dir, new_manifest)
+    print(f"Converted {built} of {len(input_files)} files into {store_dir}")
+    return new_manifest
+
+
+def delivery_columns(original_names=False, column_mapping=COLUMN_MAPPING) -> list:
+    """
+    The columns that come from the deliveries, for exports.
+
+    Leaves out batch_id and the derived tag_spans and hash columns. Exports only carry the mapped
+    fields, with the store dtypes (e.g. remarks as JSON text, level as a string).
+    """
+    return list(column_mapping) if original_names else list(column_mapping.values())
+
+
+def scan_corpus(store_dir, columns=None, batches=None, original_names=False) -> pl.LazyFrame:
+    """
+    Lazily scan the corpus store.
+
+    Selecting `columns` and `batches` early lets Polars skip the other columns and partitions.
+    With `original_names`, columns are renamed back to the delivery names (e.g. "task id").
+    """
+    lf = pl.scan_parquet(
+        os.path.join(store_dir, "**", "*.parquet"),
+        hive_partitioning=True,
+        hive_schema={"batch_id": pl.Utf8},
+    )
+    if batches is not None:
+        lf = lf.filter(pl.col("batch_id").is_in(list(batches)))
+    if columns is not None:
+        lf = lf.select(columns)
+    if original_names:
+        original_by_name = {new: original for original, new in COLUMN_MAPPING.items()}
+        lf = lf.rename(original_by_name, strict=False)
+    return lf
+
+
+def main():
+    load_dotenv(override=True)
+    DATA_DIR = os.getenv("DATA_DIR", "./data")
+
+    if not os.path.isdir(DATA_DIR):
+        raise ValueError(f"Error: Data directory '{DATA_DIR}' not found.")
+
+    SUB_DIR = input("Please enter the sub-directory for the delivery JSON files (e.g., ALL): ")
+    FILE_DIR = DATA_DIR + "/" + SUB_DIR
+    build_corpus_store(FILE_DIR, os.path.join(DATA_DIR, "corpus"))
+
+
+if __name__ == "__main__":
+    main()
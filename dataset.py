@@ -0,0 +1,135 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+import polars as pl
+
+from constants import DATA_VALS
+from ingest import get_batch_id
+from schemas import SCHEMA_VERSION, read_delivery, read_delivery_csv
+from tags import extract_tag_positions
+
+# Large text fields; only needed for the case currently on screen, search and tag extraction
+TEXT_COLUMNS = list(DATA_VALS)
+# Cached files kept per cache directory
+CACHE_SIZE = 8
+# Bump when the layout of the Arrow cache changes, so cached datasets are rebuilt
+ARROW_CACHE_VERSION = 2
+# Column of the Arrow cache holding the tag positions of the responses
+TAG_POSITIONS = "tag_spans"
+# Upload hashes kept in memory; enough for the files of the datasets load_dataset keeps
+UPLOAD_HASH_CACHE_SIZE = 64
+
+# Content hash per uploaded file id, so an upload is only hashed once per process (least recently used first)
+_upload_hashes = OrderedDict()
+
+
+def read_upload(uploaded_file) -> pl.DataFrame:
+    if uploaded_file.type == "text/csv":
+        df = read_delivery_csv(uploaded_file)
+    else:
+        df = read_delivery(uploaded_file)
+    # Delivery files are named after their batch, like in the delivery scripts
+    if "batch_id" not in df.columns:
+        df = df.with_columns(pl.lit(get_batch_id(uploaded_file.name)).alias("batch_id"))
+    return df
+
+
+def upload_hash(uploaded_file) -> str:
+    content_hash = _upload_hashes.get(uploaded_file.file_id)
+    if content_hash is None:
+        content_hash = hashlib.blake2b(uploaded_file.getvalue(), digest_size=16).hexdigest()
+        _upload_hashes[uploaded_file.file_id] = content_hash
+        if len(_upload_hashes) > UPLOAD_HASH_CACHE_SIZE:
+            _upload_hashes.popitem(last=False)
+    else:
+        _upload_hashes.move_to_end(uploaded_file.file_id)
+    return content_hash
+
+
+def upload_fingerprint(uploaded_files) -> str:
+    """Identify a set of uploaded files by name, size and content hash."""
+    digest = hashlib.blake2b(digest_size=16)
+    for uploaded_file in uploaded_files:
+        digest.update(f"{uploaded_file.name}\0{uploaded_file.size}\0{upload_hash(uploaded_file)}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def dataset_options(df: pl.DataFrame) -> dict:
+    """Filter option lists and the highest intervention round of a loaded dataset."""
+    options = {"abandon_options": [], "classification_options": [], "acc_options": [], "trainer_options": [], "model_options": []}
+    if "abandon_prompt_reason" in df.columns:
+        options["abandon_options"] = df.get_column("abandon_prompt_reason").unique().to_list()
+    if "Model performance classification" in df.columns:
+        options["classification_options"] = df.get_column("Model performance classification").unique().to_list()
+    if "ACC" in df.columns:
+        options["acc_options"] = df.get_column("ACC").cast(pl.Float64, strict=False).unique().to_list()
+    if "trainer id" in df.columns:
+        options["trainer_options"] = df.get_column("trainer id").unique().to_list()
+    if "model name" in df.columns:
+        options["model_options"] = df.get_column("model name").unique().to_list()
+    options["highest_intervention_round"] = df.get_column("intervention rounds").max()
+    return options
+
+
+def prune_cache(cache_dir: str, suffix: str, keep: int = CACHE_SIZE) -> None:
+    """Delete all but the most recently used cache files."""
+    paths = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith(suffix)]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        os.remove(path)
+
+
+def build_arrow_cache(uploaded_files, cache_dir: str, fingerprint: str) -> str:
+    """
+    Write the concatenated uploads once as an uncompressed Arrow IPC file that can be memory-mapped.
+
+    The tag positions of every response (see tags.extract_tag_positions) are stored alongside,
+    while the text is in memory anyway, so the viewer never has to read all responses again.
+    """
+    path = os.path.join(cache_dir, f"{fingerprint}-v{SCHEMA_VERSION}.{ARROW_CACHE_VERSION}.arrow")
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+
+    df = pl.concat([read_upload(uploaded_file) for uploaded_file in uploaded_files], how="diagonal")
+    if "response" in df.columns:
+        df = extract_tag_positions(df, "response", TAG_POSITIONS)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    # Memory mapping only works on uncompressed buffers
+    df.write_ipc(tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+    prune_cache(cache_dir, ".arrow")
+    return path
+
+
+def persist_upload(uploaded_file, cache_dir: str, suffix: str) -> str:
+    """Write an upload to disk once, named by its content hash, so it can be memory-mapped."""
+    path = os.path.join(cache_dir, upload_hash(uploaded_file) + suffix)
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(uploaded_file.getbuffer())
+    os.replace(tmp_path, path)
+    prune_cache(cache_dir, suffix)
+    return path
+
+
+def open_out_of_core(path: str):
+    """
+    Open a cached dataset as (metadata frame, text frame).
+
+    The text frame is memory-mapped, so rows are only paged in when they are read. The metadata
+    frame replaces every text column by its length in bytes, which keeps null checks working for
+    filters while never holding the text itself, and holds the tag positions of the responses.
+    """
+    text_df = pl.read_ipc(path, memory_map=True, rechunk=False)
+    metadata_df = text_df.with_columns(
+        pl.col(column).cast(pl.Utf8).str.len_bytes() for column in TEXT_COLUMNS if column in text_df.columns
+    )
+    return metadata_df, text_df.drop(TAG_POSITIONS, strict=False)
@@ -0,0 +1,193 @@
+import json
+import mmap
+import os
+import re
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Force a backend with JSON_DECODER=msgspec|orjson|json; by default the fastest installed one is used
+JSON_DECODER = os.getenv("JSON_DECODER", "").lower()
+NON_WHITESPACE = re.compile(rb"[^ \t\r\n]")
+# Bytes read at a time while looking for the start of a file's content
+CHUNK_SIZE = 64 * 1024
+
+
+def get_backend(name=JSON_DECODER, projected=False) -> str:
+    """
+    Pick the decoder backend.
+
+    orjson decodes whole documents fastest. When only some keys are needed, msgspec is required
+    because it never allocates the skipped values, such as the large prompt and response texts;
+    the other backends would hold whole files in memory. Set JSON_DECODER to use another backend
+    anyway.
+    """
+    if name == "msgspec" and msgspec is None or name == "orjson" and orjson is None:
+        raise ImportError(f"JSON_DECODER={name} is set, but {name} is not installed")
+    if name in ("msgspec", "orjson", "json"):
+        return name
+    if projected:
+        if msgspec is None:
+            raise ImportError("Decoding only some keys needs msgspec: pip install msgspec (or set JSON_DECODER=json)")
+        return "msgspec"
+    preferred = ["orjson", "msgspec"]
+    installed = {"msgspec": msgspec, "orjson": orjson}
+    return next((backend for backend in preferred if installed[backend] is not None), "json")
+
+
+@lru_cache(maxsize=None)
+def projection_type(fields: tuple):
+    """A msgspec Struct holding only `fields`; every other key is skipped while decoding."""
+    return msgspec.defstruct(
+        "Projection",
+        [(f"f{i}", Any, msgspec.field(default=msgspec.UNSET, name=field)) for i, field in enumerate(fields)],
+    )
+
+
+def make_decoder(fields=None, backend=None):
+    """
+    Return decode(bytes) -> object for the chosen backend.
+
+    With `fields`, decoded objects only keep those keys. msgspec skips the other values while
+    parsing; the other backends decode everything and drop them afterwards. Anything a fast
+    backend rejects (e.g. NaN) is retried with the stdlib decoder, so every backend accepts the
+    same input. Note that orjson reads integers over 64 bits as floats.
+    """
+    fields = tuple(fields) if fields is not None else None
+    backend = backend or get_backend(projected=fields is not None)
+
+    field_set = frozenset(fields or ())
+
+    def project_item(item):
+        if isinstance(item, dict):
+            return {key: val for key, val in item.items() if key in field_set}
+        return item
+
+    def project(value):
+        if fields is None:
+            return value
+        if isinstance(value, list):
+            return [project_item(item) for item in value]
+        return project_item(value)
+
+    def decode_json(data):
+        # The stdlib decoder only takes bytes, so a memory-mapped document is copied here
+        return project(json.loads(data if isinstance(data, bytes) else bytes(data)))
+
+    if backend == "msgspec" and fields is not None:
+        decoder = msgspec.json.Decoder(projection_type(fields))
+        raw_decoder = msgspec.json.Decoder(msgspec.Raw)
+        names = [(f"f{i}", field) for i, field in enumerate(fields)]
+
+        def decode_object(data):
+            obj = decoder.decode(data)
+            return {field: value for attr, field in names if (value := getattr(obj, attr)) is not msgspec.UNSET}
+
+        def decode(data):
+            try:
+                # Arrays are split into raw items, so items that are not objects can be handled like the stdlib does
+                if first_byte(data) == b"[":
+                    return [decode_item(item) for item in msgspec.json.decode(data, type=list[msgspec.Raw])]
+                return decode_item(raw_decoder.decode(data))
+            except (msgspec.DecodeError, ValueError):
+                return decode_json(data)
+
+        def decode_item(raw):
+            try:
+                return decode_object(raw)
+            except msgspec.ValidationError:
+                return msgspec.json.decode(raw)
+
+        return decode
+
+    if backend == "msgspec":
+        def decode(data):
+            try:
+                return msgspec.json.decode(data)
+            except msgspec.DecodeError:
+                return decode_json(data)
+
+        return decode
+
+    if backend == "orjson":
+        def decode(data):
+            try:
+                return project(orjson.loads(data))
+            except orjson.JSONDecodeError:
+                return decode_json(data)
+
+        return decode
+
+    return decode_json
+
+
+@contextmanager
+def open_document(f, backend):
+    """
+    The whole content of an open file, for decoding it as a single JSON document.
+
+    msgspec reads straight from a read-only memory mapping, so the file is paged in by the OS
+    instead of being copied onto the heap, and values skipped by a projection never take up memory.
+    The other backends need the content as bytes.
+    """
+    size = os.fstat(f.fileno()).st_size
+    if backend != "msgspec" or size == 0:
+        yield f.read()
+        return
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield mm
+    finally:
+        try:
+            mm.close()
+        except BufferError:
+            pass  # a decoded value still references the mapping; it is unmapped once that is freed
+
+
+def first_byte(data) -> bytes:
+    match = NON_WHITESPACE.search(data)
+    return data[match.start():match.start() + 1] if match else b""
+
+
+def iter_lines(f):
+    """Yield the non-blank lines of an open JSONL file, one line in memory at a time."""
+    for line in f:
+        if NON_WHITESPACE.search(line):
+            yield line
+
+
+def detect_format(f, decode) -> str:
+    """
+    "document" for a single JSON value, "jsonl" for one object per line.
+
+    The first non-whitespace byte decides: "[" is a document. "{" is JSONL if the first line is a
+    complete object on its own, otherwise a single pretty-printed object. Only the start of the
+    file is read, and the file is rewound afterwards.
+    """
+    try:
+        while chunk := f.read(CHUNK_SIZE):
+            match = NON_WHITESPACE.search(chunk)
+            if match:
+                break
+        else:
+            return "document"
+        if chunk[match.start():match.start() + 1] != b"{":
+            return "document"
+        f.seek(f.tell() - len(chunk) + match.start())
+        try:
+            decode(f.readline())
+        except ValueError:
+            return "document"
+        return "jsonl"
+    finally:
+        f.seek(0)
@@ -0,0 +1,120 @@
+import argparse
+import os
+
+import polars as pl
+from dotenv import load_dotenv
+
+from corpus_store import scan_corpus
+from sinks import OUTPUT_FORMATS, atomic_path, output_path, sink_frame
+from survivors import ROW, survivor_order
+from text_hash import hash_columns
+
+# Columns of the dedup index besides the content hashes; the texts themselves are never read
+INDEX_COLUMNS = ["task_id", "question_id", "model_name", "batch_id"]
+INDEX_NAME = "dedup_index.parquet"
+GROUPS_NAME = "dedup_groups"
+# Keys duplicates are reported for: ids, exact content and content up to case and whitespace
+REPORT_KEYS = {
+    "task_id": "task id",
+    "question_id": "question id",
+    "prompt_hash": "prompt (exact)",
+    "prompt_norm_hash": "prompt (normalized)",
+    "response_hash": "response (exact)",
+}
+
+
+def build_index(store_dir, index_path):
+    """
+    Write the id -> content hash -> batch index of the corpus store to a Parquet file.
+
+    Only the id and hash columns are scanned, and the index is streamed to disk.
+    """
+    lf = scan_corpus(store_dir, columns=INDEX_COLUMNS + hash_columns()).with_row_index(ROW)
+    with atomic_path(index_path) as tmp_path:
+        lf.sink_parquet(tmp_path)
+    return pl.scan_parquet(index_path)
+
+
+def load_index(index_path) -> pl.LazyFrame:
+    return pl.scan_parquet(index_path)
+
+
+def duplicate_groups(index, key) -> pl.DataFrame:
+    """
+    Every value of `key` that occurs more than once, with its batches and the surviving row.
+
+    "distinct_prompts" tells whether the duplicates really share their prompt.
+    """
+    return (
+        survivor_order(index.lazy().filter(pl.col(key).is_not_null()))
+        .group_by(key, maintain_order=True)
+        .agg(
+            pl.len().alias("count"),
+            pl.col("batch_id").unique(maintain_order=True).alias("batches"),
+            pl.col("batch_id").first().alias("survivor_batch"),
+            pl.col(ROW).first().alias("survivor_row"),
+            pl.col("prompt_hash").n_unique().alias("distinct_prompts"),
+        )
+        .filter(pl.col("count") > 1)
+        .sort(key)
+        .collect()
+    )
+
+
+def all_duplicate_groups(index) -> pl.DataFrame:
+    """duplicate_groups of every report key in one frame, with the key label and its value as a string."""
+    return pl.concat(
+        [
+            duplicate_groups(index, key).select(
+                pl.lit(label).alias("key"),
+                pl.col(key).cast(pl.Utf8).alias("value"),
+                pl.exclude(key),
+            )
+            for key, label in REPORT_KEYS.items()
+        ]
+    )
+
+
+def duplicate_summary(index) -> pl.DataFrame:
+    """Number of duplicate groups and of rows that would be dropped, per report key."""
+    def counts_expr(key, label):
+        duplicated = pl.col(key).is_not_null() & pl.col(key).is_duplicated()
+        return pl.struct(
+            duplicated.sum().alias("duplicate_rows"),
+            pl.col(key).filter(duplicated).n_unique().alias("groups"),
+        ).alias(label)
+
+    counts = index.lazy().select(counts_expr(key, label) for key, label in REPORT_KEYS.items()).collect()
+    return pl.DataFrame(
+        [{"key": label, **counts.get_column(label)[0]} for label in REPORT_KEYS.values()]
+    ).with_columns((pl.col("duplicate_rows") - pl.col("groups")).alias("dropped"))
+
+
+def main():
+    load_dotenv(override=True)
+    DATA_DIR = os.getenv("DATA_DIR", "./data")
+    store_dir = os.path.join(DATA_DIR, "corpus")
+
+    parser = argparse.ArgumentParser(description="Index the content hashes of the corpus store and report duplicates")
+    parser.add_argument("--groups", action="store_true", help=f"Also write every duplicate group to DATA_DIR/{GROUPS_NAME}")
+    # The batches of a group are a list, which CSV can't hold
+    parser.add_argument("--format", choices=[f for f in OUTPUT_FORMATS if f != "csv"], default="parquet", help="Format of the duplicate groups")
+    args = parser.parse_args()
+
+    if not os.path.isdir(store_dir):
+        raise ValueError(f"Error: Corpus store '{store_dir}' not found. Build it first with `python corpus_store.py`.")
+
+    index_path = os.path.join(DATA_DIR, INDEX_NAME)
+    index = build_index(store_dir, index_path)
+    print(f"Dedup index written to {index_path}")
+    print(duplicate_summary(index))
+
+    if args.groups:
+        groups_path = output_path(DATA_DIR, GROUPS_NAME, args.format)
+        groups = all_duplicate_groups(index)
+        sink_frame(groups.lazy(), groups_path, args.format)
+        print(f"{groups.height} duplicate groups written to {groups_path}")
+
+
+if __name__ == "__main__":
+    main()
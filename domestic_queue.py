@@ -1,10 +1,17 @@
+import os
 import streamlit as st
 from streamlit_shortcuts import button
 from streamlit_scroll_navigation import scroll_navbar
 import polars as pl
+from dotenv import load_dotenv
 from constants import SCROLLBAR_STYLES
+from dataset import persist_upload, upload_hash
+from ndjson_index import build_line_index, open_mmap, read_line, scan_queue
 from utils import clean_text
 
+load_dotenv(override=True)
+DATA_DIR = os.getenv("DATA_DIR", "./data")
+
 st.set_page_config(layout="wide", page_title="RLMF Domestic Queue", page_icon="👀")
 
 default_state = {
@@ -32,9 +39,17 @@ def previous_evaluation():
     )
 
 
-@st.cache_data
-def read_file(file_path: str) -> pl.DataFrame:
-    return pl.read_ndjson(file_path)
+@st.cache_resource(max_entries=4)
+def load_queue(content_hash: str, _evaluation_file):
+    """
+    Store the upload under DATA_DIR/.queue_cache, memory-map it and index its line offsets.
+
+    Only the link and the Answer.data flags are decoded for all rows; the full record, with the
+    nested step_info, is decoded per row with read_line.
+    """
+    path = persist_upload(_evaluation_file, os.path.join(DATA_DIR, ".queue_cache"), ".jsonl")
+    mm = open_mmap(path)
+    return mm, build_line_index(mm), scan_queue(path)
 
 
 def process_step(step_text: str) -> str:
@@ -42,25 +57,23 @@ def process_step(step_text: str) -> str:
 
 
 def retrieve_stats(df: pl.DataFrame) -> pl.DataFrame:
-    stats = pl.DataFrame(
-        {
-            "total": len(df),
-            "abandoned": df.filter(
-                pl.col("Answer").struct.field("data").struct.field("fake_abandon")
-                == "Yes"
-            ).shape[0],
-            "zero_interventions": df.filter(
-                pl.col("Answer").struct.field("data").struct.field("cot_qualify")
-                == "Perfect"
-            ).shape[0],
-        }
+    # All counts in one pass over the Answer.data struct
+    answer_data = pl.col("Answer").struct.field("data")
+    abandoned = (answer_data.struct.field("fake_abandon") == "Yes").sum()
+    zero_interventions = (answer_data.struct.field("cot_qualify") == "Perfect").sum()
+    total = pl.len().cast(pl.Int64)
+    return df.select(
+        total.alias("total"),
+        abandoned.alias("abandoned"),
+        zero_interventions.alias("zero_interventions"),
+        (total - abandoned - zero_interventions).alias("effective"),
     )
-    stats = stats.with_columns(
-        (pl.col("total") - pl.col("abandoned") - pl.col("zero_interventions")).alias(
-            "effective"
-        )
-    )
-    return stats
+
+
+@st.cache_resource(max_entries=4)
+def load_stats(content_hash: str, _df: pl.DataFrame) -> pl.DataFrame:
+    # Computed once per uploaded file; arguments starting with an underscore are not hashed
+    return retrieve_stats(_df)
 
 
 def search_evaluation():
@@ -90,37 +103,40 @@ def search_evaluation():
 evaluation_file = st.file_uploader("Upload exported data", type=["jsonl"])
 
 if evaluation_file:
-    df = read_file(evaluation_file)
+    content_hash = upload_hash(evaluation_file)
+    mm, line_index, df = load_queue(content_hash, evaluation_file)
 
-    curr_df = df.slice(current_index, 1)
+    record = read_line(mm, line_index, current_index)
+    curr_df = pl.DataFrame([record])
 
-    answer_data = curr_df["Answer"].item()["data"]
+    # A single decoded record has no unified schema, so optional fields are read with .get
+    answer_data = (record.get("Answer") or {}).get("data") or {}
 
-    steps = answer_data["step_info"]
+    steps = answer_data.get("step_info") or []
 
     st.header("Data Info", anchor="Data Info")
     st.subheader("All Cases")
-    stats = retrieve_stats(df)
+    stats = load_stats(content_hash, df)
     st.table(stats.unpivot(variable_name="category", value_name="value"))
 
     st.subheader("Current Case")
     stats = pl.DataFrame(
         {
-            "question_id": curr_df["link"].item(),
-            "cot_quality": answer_data["cot_qualify"],
-            "abandoned": answer_data["fake_abandon"] == "Yes",
-            "model_performance": answer_data["model_performance"][0],
-            "submission_id": answer_data["submission_id"],
-            "item_id": curr_df["ItemID"],
-            "task_id": curr_df["TaskID"],
-            "operator": curr_df["Operator"],
+            "question_id": record.get("link"),
+            "cot_quality": answer_data.get("cot_qualify"),
+            "abandoned": answer_data.get("fake_abandon") == "Yes",
+            "model_performance": (answer_data.get("model_performance") or [None])[0],
+            "submission_id": answer_data.get("submission_id"),
+            "item_id": record.get("ItemID"),
+            "task_id": record.get("TaskID"),
+            "operator": record.get("Operator"),
         }
     ).unpivot(variable_name="category", value_name="value")
 
     st.table(stats)
 
     st.header("Prompt", anchor="Prompt")
-    st.write(clean_text(answer_data["prompt"], "prompt"))
+    st.write(clean_text(answer_data.get("prompt") or "", "prompt"))
 
     st.header("Reasoning Steps", anchor="Reasoning Steps")
 
@@ -129,31 +145,31 @@ if evaluation_file:
     annotation_rounds = []
 
     for step in steps:
-        if step["final_type"] == "critique":
+        if step.get("final_type") == "critique":
             critique_rounds += 1
             annotation_rounds.append(
                 {"annotation_type": "Critique", "round_number": critique_rounds}
             )
             st.subheader("", anchor=f"Critique {critique_rounds}")
-            st.error(process_step(step["think"]))
+            st.error(process_step(step.get("think")))
             st.info(
                 process_step(
-                    step["critique"] if step["critique"] else step["critique_temp"]
+                    step.get("critique") if step.get("critique") else step.get("critique_temp")
                 )
             )
-        elif step["final_type"] == "intervene" or step["origint_think"]:
+        elif step.get("final_type") == "intervene" or step.get("origint_think"):
             intervene_rounds += 1
             annotation_rounds.append(
                 {"annotation_type": "Intervene", "round_number": intervene_rounds}
             )
             st.subheader("", anchor=f"Intervene {intervene_rounds}")
-            st.error(process_step(step["origint_think"]))
-            st.warning(process_step(step["intervene"]))
-        elif step["final_answer"]:
+            st.error(process_step(step.get("origint_think")))
+            st.warning(process_step(step.get("intervene")))
+        elif step.get("final_answer"):
             st.header("Final Answer", anchor="Final Answer")
-            st.write(process_step(step["final_answer"]))
+            st.write(process_step(step.get("final_answer")))
         else:
-            st.write(process_step(step["think"]))
+            st.write(process_step(step.get("think")))
 
     with st.sidebar:
         col1, col2 = st.columns(2)
@@ -202,9 +218,9 @@ if evaluation_file:
                 override_styles=SCROLLBAR_STYLES,
             )
 
-    if answer_data["gt_answer"]:
+    if answer_data.get("gt_answer"):
         st.header("Ground Truth", anchor="Ground Truth")
-        st.write("```cpp\n" + answer_data["gt_answer"] + "\n```")
+        st.write("```cpp\n" + answer_data.get("gt_answer") + "\n```")
 
     st.header("Raw Data", anchor="Raw Data")
     try:
@@ -0,0 +1,123 @@
+import argparse
+import operator
+import os
+from functools import reduce
+
+import polars as pl
+from dotenv import load_dotenv
+
+from constants import COLUMN_MAPPING, DATA_VALS
+from corpus_store import scan_corpus
+from ingest import scan_processed_files
+from sinks import OUTPUT_FORMATS, output_path, sink_frame
+
+# Escape and encoding anomalies, one bit each in the order listed (Rust regex syntax, over the decoded text)
+ANOMALY_PATTERNS = {
+    # Four backslashes before "n" (eight in the delivery JSON): a line break escaped too often
+    "escaped_newline": r"\\{4}n",
+    # Runs of four or more backslashes (eight or more in the delivery JSON)
+    "backslash_run": r"\\{4,}",
+    "long_backslash_run": r"\\{8,}",
+    # Escapes that were never decoded, e.g. "\u00e9" for "é"
+    "unicode_escape": r"\\u[0-9a-fA-F]{4}",
+    # UTF-8 read as Latin-1 or cp1252, e.g. "Ã©" for "é" and "â€™" for "’"
+    "mojibake": r"Ã[\x{80}-\x{BF}]|â[\x{80}-\x{9F}]|â€",
+    "replacement_char": r"\x{FFFD}",
+    "control_char": r"[\x00-\x08\x0B\x0C\x0E-\x1F]",
+}
+ANOMALY_BITS = {name: 1 << bit for bit, name in enumerate(ANOMALY_PATTERNS)}
+
+# Text columns of the corpus store (mapped names, e.g. "user_prompt")
+TEXT_COLUMNS = [COLUMN_MAPPING[field] for field in [*DATA_VALS, "initial_reasoning"] if field in COLUMN_MAPPING]
+ID_COLUMNS = ["task_id", "question_id", "model_name", "batch_id"]
+REPORT_COLUMNS = {"batch": "batch_id", "model": "model_name"}
+OUTPUT_NAME = "escape_anomalies"
+
+
+def column_mask(column: str) -> pl.Expr:
+    """Bitmask of the anomalies found in one text column; 0 when there are none or the text is missing."""
+    text = pl.col(column)
+    return pl.sum_horizontal(
+        text.str.contains(pattern).fill_null(False).cast(pl.UInt8) * ANOMALY_BITS[name]
+        for name, pattern in ANOMALY_PATTERNS.items()
+    ).cast(pl.UInt8)
+
+
+def scan_anomalies(lf: pl.LazyFrame, text_columns=TEXT_COLUMNS) -> pl.LazyFrame:
+    """
+    The ids of every row with one anomaly mask per text column and their union, "anomalies".
+
+    Every pattern runs over every text column in a single select, so the texts are read once and
+    only the ids and masks are kept.
+    """
+    columns = lf.collect_schema().names()
+    text_columns = [column for column in text_columns if column in columns]
+    masks = [column_mask(column).alias(f"{column}_anomalies") for column in text_columns]
+    return lf.select(
+        *[column for column in ID_COLUMNS if column in columns],
+        reduce(operator.or_, masks, pl.lit(0, dtype=pl.UInt8)).alias("anomalies"),
+        *masks,
+    )
+
+
+def has_anomaly(name: str, column: str = "anomalies") -> pl.Expr:
+    """E.g. df.filter(has_anomaly("backslash_run", "response_anomalies"))."""
+    return (pl.col(column) & ANOMALY_BITS[name]) != 0
+
+
+def anomaly_names(mask: int) -> list:
+    return [name for name, bit in ANOMALY_BITS.items() if mask & bit]
+
+
+def anomaly_counts(anomalies, by: str) -> pl.DataFrame:
+    """Rows, flagged rows and rows per anomaly for every value of `by` (e.g. "batch_id")."""
+    return (
+        anomalies.lazy()
+        .group_by(by)
+        .agg(
+            pl.len().alias("rows"),
+            (pl.col("anomalies") != 0).sum().alias("flagged"),
+            *[has_anomaly(name).sum().alias(name) for name in ANOMALY_PATTERNS],
+        )
+        .sort(by, nulls_last=True)
+        .collect()
+    )
+
+
+def main():
+    load_dotenv(override=True)
+    DATA_DIR = os.getenv("DATA_DIR", "./data")
+
+    parser = argparse.ArgumentParser(description="Scan deliveries for over-escaped text and encoding anomalies")
+    parser.add_argument("--source", choices=["corpus", "files"], default="corpus",
+                        help="The Parquet corpus store under DATA_DIR/corpus (default), or the delivery files of a sub-directory")
+    parser.add_argument("--sub-dir", help="Sub-directory of the delivery files with --source files (e.g. ALL)")
+    parser.add_argument("--format", choices=list(OUTPUT_FORMATS), default="parquet", help="Format of the flagged rows")
+    args = parser.parse_args()
+
+    if args.source == "corpus":
+        store_dir = os.path.join(DATA_DIR, "corpus")
+        if not os.path.isdir(store_dir):
+            raise ValueError(f"Error: Corpus store '{store_dir}' not found. Build it with `python corpus_store.py` or use --source files.")
+        lf = scan_corpus(store_dir)
+    else:
+        SUB_DIR = args.sub_dir or input("Please enter the sub-directory for the delivery JSON files (e.g., ALL): ")
+        lf = scan_processed_files(DATA_DIR + "/" + SUB_DIR, COLUMN_MAPPING, cache_dir=os.path.join(DATA_DIR, ".ingest_cache"))
+
+    anomalies = scan_anomalies(lf).collect(engine="streaming")
+
+    with pl.Config(tbl_rows=-1, tbl_cols=-1):
+        for label, column in REPORT_COLUMNS.items():
+            if column in anomalies.columns:
+                print(f"\nAnomalies per {label}:")
+                print(anomaly_counts(anomalies, column))
+
+    output_file_path = output_path(DATA_DIR, OUTPUT_NAME, args.format)
+    flagged = anomalies.filter(pl.col("anomalies") != 0)
+    sink_frame(flagged.lazy(), output_file_path, args.format)
+    print(f"\n{flagged.height} of {anomalies.height} rows flagged, written to {output_file_path}")
+    print("Bits: " + ", ".join(f"{bit} = {name}" for name, bit in ANOMALY_BITS.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+from functools import reduce
+
+import polars as pl
+
+# Session state keys that make up the viewer's filter state
+FILTER_STATE_KEYS = [
+    "abandon_filter",
+    "intervention_filter",
+    "ground_truth_solutions_filter",
+    "model_choices",
+    "abandon_choices",
+    "classification_choices",
+    "acc_choices",
+    "trainer_choices",
+    "intervention_slider_filter",
+]
+
+
+def get_filter_state(session_state, highest_intervention_round) -> dict:
+    """Snapshot the filter widgets' values from the session state."""
+    filter_state = {key: session_state.get(key) for key in FILTER_STATE_KEYS}
+    for key in ["model_choices", "abandon_choices", "classification_choices", "acc_choices", "trainer_choices"]:
+        filter_state[key] = filter_state[key] or []
+    if "intervention_slider_filter" not in session_state:
+        filter_state["intervention_slider_filter"] = (0, highest_intervention_round)
+    return filter_state
+
+
+def filter_state_key(filter_state: dict) -> tuple:
+    """Hashable key of a filter state, used to memoize the filtered frame."""
+    return tuple(
+        (key, tuple(value) if isinstance(value, (list, tuple)) else value)
+        for key, value in sorted(filter_state.items())
+    )
+
+
+def compile_filter_expr(filter_state: dict) -> pl.Expr:
+    """Compile the filter state into a single predicate, so filtering is one fused pass."""
+    predicates = []
+
+    if filter_state.get("abandon_filter") == "Abandoned":
+        predicates.append(pl.col("abandon_prompt") == "Yes")
+    elif filter_state.get("abandon_filter") == "Not abandoned":
+        predicates.append(pl.col("abandon_prompt") != "Yes")
+    if filter_state.get("intervention_filter") == "Has interventions":
+        predicates.append(pl.col("intervention rounds") > 0)
+    elif filter_state.get("intervention_filter") == "No interventions":
+        predicates.append(pl.col("intervention rounds") == 0)
+    if filter_state.get("ground_truth_solutions_filter") == "Has ground truth":
+        predicates.append(pl.col("ground_truth_answer").is_not_null())
+    elif filter_state.get("ground_truth_solutions_filter") == "No ground truth":
+        predicates.append(pl.col("ground_truth_answer").is_null())
+
+    if filter_state["model_choices"]:
+        predicates.append(pl.col("model name").is_in(filter_state["model_choices"]))
+    if filter_state["abandon_choices"]:
+        predicates.append(pl.col("abandon_prompt_reason").is_in(filter_state["abandon_choices"]))
+    if filter_state["classification_choices"]:
+        predicates.append(pl.col("Model performance classification").is_in(filter_state["classification_choices"]))
+    if filter_state["acc_choices"]:
+        predicates.append(pl.col("ACC").cast(pl.Float64, strict=False).is_in(filter_state["acc_choices"]))
+    if filter_state["trainer_choices"]:
+        predicates.append(pl.col("trainer id").is_in(filter_state["trainer_choices"]))
+
+    intervention_slider_filter = filter_state.get("intervention_slider_filter")
+    if intervention_slider_filter is not None:
+        predicates.append(
+            pl.col("intervention rounds").cast(pl.Int32, strict=False).is_between(
+                intervention_slider_filter[0], intervention_slider_filter[1]
+            )
+        )
+
+    if not predicates:
+        return pl.lit(True)
+    return reduce(lambda a, b: a & b, predicates)
+
+
+def build_position_index(positions: list) -> dict:
+    """Reverse map from row position in the full frame to its rank among the filtered rows."""
+    return {position: rank for rank, position in enumerate(positions)}
+
+
+def step_position(positions: list, position_index: dict, current_index: int, step: int):
+    """
+    Move `step` rows through the filtered positions, wrapping around at either end.
+
+    If the current row is not part of the filtered set, jump to the first (or last) match.
+    """
+    if not positions:
+        return None
+    rank = position_index.get(current_index)
+    if rank is None:
+        return positions[0] if step > 0 else positions[-1]
+    return positions[(rank + step) % len(positions)]
@@ -1,134 +1,26 @@
 import json
 import os
-import glob
+import polars as pl
 from dotenv import load_dotenv
+from constants import COLUMN_MAPPING
+from ingest import scan_processed_files
+from rules import apply_rule
+from sinks import output_path, sink_frame
 
-COLUMN_MAPPING = {
-    'task id': 'task_id',
-    'trainer id': 'trainer_id',
-    'model name': 'model_name',
-    'question_id': 'question_id',
-    'system prompt': 'system_prompt',
-    'user prompt': 'user_prompt',
-    'level': 'level',
-    'ACC': 'acc',
-    'intervene_system_prompt': 'intervene_system_prompt',
-    'intervene prompt': 'intervene_prompt',
-    'ground_truth_answer': 'ground_truth_answer',
-    'temperature': 'temperature',
-    'total_tokens': 'total_tokens',
-    'total_latency (ms)': 'total_latency_ms',
-    'initial_reasoning': 'initial_reasoning',
-    'response': 'response',
-    # 'initial_response': 'initial_response',
-    'final_answer': 'final_answer',
-    'abandon_prompt': 'abandon_prompt',
-    'abandon_prompt_reason': 'abandon_prompt_reason',
-    'intervention rounds': 'intervention_rounds',
-    'CoT quality': 'cot_quality',
-    'remarks': 'remarks',
-    'Model performance classification': 'model_performance_classification',
-    'codeforces_submission_id':'codeforces_submission_id',
-    'programming_language': 'programming_language',
-}
+def scan_effective_labels(data_dir, cache_dir=None):
+    # "Effective Labels" are defined by the "effective" rule in rules.json (not abandoned, with interventions)
+    items = scan_processed_files(data_dir, COLUMN_MAPPING, cache_dir=cache_dir)
+    return apply_rule(items, "effective", COLUMN_MAPPING)
 
-def process_json_files(data_dir):
-    all_processed_items = []
-    all_column_names = set(COLUMN_MAPPING.values()) # Start with mapped names
-
-    # Recursively find all .json and .jsonl files
-    json_files = glob.glob(os.path.join(data_dir, '**', '*.json'), recursive=True)
-    jsonl_files = glob.glob(os.path.join(data_dir, '**', '*.jsonl'), recursive=True)
-    all_input_files = json_files + jsonl_files
-
-    for file_path in all_input_files:
-        print(f"Processing file: {file_path}")
-        # Extract batch_id from filename
-        basename = os.path.basename(file_path)
-        batch_id = os.path.splitext(basename)[0]
-        
-        items = []
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                if file_path.endswith('.jsonl'):
-                    for line in f:
-                        try:
-                            items.append(json.loads(line))
-                        except json.JSONDecodeError as e_line:
-                            print(f"Skipping line in {file_path} due to JSON decode error: {e_line}")
-                elif file_path.endswith('.json'):
-                    try:
-                        content = json.load(f)
-                        if isinstance(content, list):
-                            items = content
-                        elif isinstance(content, dict): # Handle case where a .json file might contain a single object
-                            items = [content]
-                        else:
-                            print(f"Skipping file {file_path}: content is not a list or dict of JSON objects.")
-                    except json.JSONDecodeError as e_file:
-                        print(f"Skipping file {file_path} due to JSON decode error: {e_file}")
-                        # As a fallback for .json, try to read as JSONL if initial parse fails
-                        # This might happen if a .json file is actually in JSONL format
-                        f.seek(0) # Reset file pointer to the beginning
-                        try:
-                            print(f"Attempting to read {file_path} as JSONL...")
-                            current_items = []
-                            for line in f:
-                                try:
-                                    current_items.append(json.loads(line))
-                                except json.JSONDecodeError as e_line_fallback:
-                                    print(f"Skipping line in {file_path} (fallback JSONL) due to JSON decode error: {e_line_fallback}")
-                            items = current_items
-                        except Exception as e_fallback:
-                            print(f"Failed to read {file_path} as JSONL fallback: {e_fallback}")
-
-        except Exception as e:
-            print(f"Could not read or process file {file_path}: {e}")
-            continue
-
-        for item in items:
-            if not isinstance(item, dict):
-                print(f"Skipping non-dictionary item in {file_path}: {item}")
-                continue
-            
-            processed_item = {}
-            # Apply column mapping and collect all original column names
-            for original_key, value in item.items():
-                if original_key in COLUMN_MAPPING:
-                    new_key = COLUMN_MAPPING.get(original_key, original_key) # Use original key if not in mapping
-                    if 'id' in new_key:  # Convert any form of ID to string
-                        value = str(value)
-                    processed_item[new_key] = value
-                    all_column_names.add(new_key) # Add the key used (either mapped or original)
-            
-            # Add batch_id
-            processed_item['batch_id'] = batch_id
-            all_column_names.add('batch_id')
-            
-            all_processed_items.append(processed_item)
-
-    # Filter "Effective Labels" (where `abandon_prompt` == "No" and `intervention_rounds` > 0)
-    filtered_items = [
-        item for item in all_processed_items 
-            if 
-                (isinstance(item.get('abandon_prompt'), str) and item.get('abandon_prompt').lower() == 'no' and int(item.get('intervention_rounds')) > 0)
-                and 
-                item.get('task_id') != '69492'  # known problematic task with hard-coded solution (from Batch 20)
-    ]
-
-    # Ensure all filtered items have all collected columns
-    final_output_items = []
-    for item in filtered_items:
-        standardized_item = {}
-        for col_name in all_column_names:
-            standardized_item[col_name] = item.get(col_name) # Defaults to None if key is missing
-        final_output_items.append(standardized_item)
-        
-    return final_output_items
+def process_json_files(data_dir, cache_dir=None):
+    return scan_effective_labels(data_dir, cache_dir).collect().to_dicts()
 
 def main():
     load_dotenv(override=True)
     DATA_DIR = os.getenv('DATA_DIR', './data')
+    # json (default), ndjson, csv or parquet
+    OUTPUT_FORMAT = os.getenv('OUTPUT_FORMAT', 'json')
+    output_file_path = output_path(DATA_DIR, 'rlmf_effective_labels', OUTPUT_FORMAT)
 
     # Ensure the DATA_DIR exists
     if not os.path.isdir(DATA_DIR):
@@ -136,17 +28,18 @@ def main():
     else:
         SUB_DIR = input("Please enter the sub-directory for the delivery JSON files (e.g., ALL): ")
         FILE_DIR = DATA_DIR + "/" + SUB_DIR
-        output_data = process_json_files(FILE_DIR)
+        # Each file is cached as a Parquet frame, so later runs only parse new or changed deliveries
+        output_data = scan_effective_labels(FILE_DIR, cache_dir=os.path.join(DATA_DIR, '.ingest_cache'))
 
-    if output_data:
-        print(f"\nFound {len(output_data)} items.")
+    count = output_data.select(pl.len()).collect().item()
+    if count:
+        print(f"\nFound {count} items.")
         print("Details of the first item (if any):")
-        print(json.dumps(output_data[0], indent=4))
+        print(json.dumps(output_data.head(1).collect().row(0, named=True), indent=4))
 
-        output_file_path = os.path.join(DATA_DIR, 'rlmf_effective_labels.json')
+        # Items are written as they are produced, and the file only replaces the previous output once complete
         try:
-            with open(output_file_path, 'w', encoding='utf-8') as outfile:
-                json.dump(output_data, outfile, indent=4)
+            sink_frame(output_data, output_file_path, OUTPUT_FORMAT)
             print(f"\nOutput successfully written to {output_file_path}")
         except IOError as e:
             print(f"\nError writing output to {output_file_path}: {e}")
@@ -155,4 +48,3 @@ def main():
 
 if __name__ == '__main__':
     main()
-    
\ No newline at end of file
@@ -1,9 +1,11 @@
 import json
 import os
-import glob
+import polars as pl
 from dotenv import load_dotenv
-import pandas as pd
+from ingest import scan_processed_files
+from sinks import output_path, sink_frame
 
+# Text columns are left out, so their values are skipped while decoding and never held in memory
 COLUMN_MAPPING = {
     'task id': 'task_id',
     'trainer id': 'trainer_id',
@@ -33,98 +35,20 @@ COLUMN_MAPPING = {
     'programming_language': 'programming_language',
 }
 
-def process_json_files(data_dir):
-    all_processed_items = []
-    all_column_names = set(COLUMN_MAPPING.values()) # Start with mapped names
-
-    # Recursively find all .json and .jsonl files
-    json_files = glob.glob(os.path.join(data_dir, '**', '*.json'), recursive=True)
-    jsonl_files = glob.glob(os.path.join(data_dir, '**', '*.jsonl'), recursive=True)
-    all_input_files = json_files + jsonl_files
-
-    for file_path in all_input_files:
-        print(f"Processing file: {file_path}")
-        # Extract batch_id from filename
-        basename = os.path.basename(file_path)
-        batch_id = os.path.splitext(basename)[0]
-        
-        items = []
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                if file_path.endswith('.jsonl'):
-                    for line in f:
-                        try:
-                            items.append(json.loads(line))
-                        except json.JSONDecodeError as e_line:
-                            print(f"Skipping line in {file_path} due to JSON decode error: {e_line}")
-                elif file_path.endswith('.json'):
-                    try:
-                        content = json.load(f)
-                        if isinstance(content, list):
-                            items = content
-                        elif isinstance(content, dict): # Handle case where a .json file might contain a single object
-                            items = [content]
-                        else:
-                            print(f"Skipping file {file_path}: content is not a list or dict of JSON objects.")
-                    except json.JSONDecodeError as e_file:
-                        print(f"Skipping file {file_path} due to JSON decode error: {e_file}")
-                        # As a fallback for .json, try to read as JSONL if initial parse fails
-                        # This might happen if a .json file is actually in JSONL format
-                        f.seek(0) # Reset file pointer to the beginning
-                        try:
-                            print(f"Attempting to read {file_path} as JSONL...")
-                            current_items = []
-                            for line in f:
-                                try:
-                                    current_items.append(json.loads(line))
-                                except json.JSONDecodeError as e_line_fallback:
-                                    print(f"Skipping line in {file_path} (fallback JSONL) due to JSON decode error: {e_line_fallback}")
-                            items = current_items
-                        except Exception as e_fallback:
-                            print(f"Failed to read {file_path} as JSONL fallback: {e_fallback}")
-
-        except Exception as e:
-            print(f"Could not read or process file {file_path}: {e}")
-            continue
-
-        for item in items:
-            if not isinstance(item, dict):
-                print(f"Skipping non-dictionary item in {file_path}: {item}")
-                continue
-            
-            processed_item = {}
-            # Apply column mapping and collect all original column names
-            for original_key, value in item.items():
-                if original_key in COLUMN_MAPPING:
-                    new_key = COLUMN_MAPPING.get(original_key, original_key) # Use original key if not in mapping
-                    if 'id' in new_key:  # Convert any form of ID to string
-                        value = str(value)
-                    processed_item[new_key] = value
-                    all_column_names.add(new_key) # Add the key used (either mapped or original)
-            
-            # Add batch_id
-            processed_item['batch_id'] = batch_id
-            all_column_names.add('batch_id')
-            
-            all_processed_items.append(processed_item)
-
+def scan_metadata(data_dir, cache_dir=None):
     # No filter
-    filtered_items = all_processed_items
+    return scan_processed_files(data_dir, COLUMN_MAPPING, cache_dir=cache_dir)
 
-    # Ensure all filtered items have all collected columns
-    final_output_items = []
-    for item in filtered_items:
-        standardized_item = {}
-        for col_name in all_column_names:
-            standardized_item[col_name] = item.get(col_name) # Defaults to None if key is missing
-        final_output_items.append(standardized_item)
-        
-    return final_output_items
+def process_json_files(data_dir, cache_dir=None):
+    return scan_metadata(data_dir, cache_dir).collect().to_dicts()
 
 
 def main():
     load_dotenv(override=True)
     DATA_DIR = os.getenv('DATA_DIR', './data')
+    # csv (default), json, ndjson or parquet
+    OUTPUT_FORMAT = os.getenv('OUTPUT_FORMAT', 'csv')
+    output_file_path = output_path(DATA_DIR, 'metadata', OUTPUT_FORMAT)
 
     # Ensure the DATA_DIR exists
     if not os.path.isdir(DATA_DIR):
@@ -132,25 +56,19 @@ def main():
     else:
         SUB_DIR = input("Please enter the sub-directory for the delivery JSON files (e.g., ALL): ")
         FILE_DIR = DATA_DIR + "/" + SUB_DIR
-        output_data = process_json_files(FILE_DIR)
+        # Each file is cached as a Parquet frame, so later runs only parse new or changed deliveries
+        metadata = scan_metadata(FILE_DIR, cache_dir=os.path.join(DATA_DIR, '.ingest_cache'))
 
-    if output_data:
-        print(f"\nFound {len(output_data)} items.")
+    # Row counts come from the Parquet footers; nothing is decoded until the output is written
+    count = metadata.select(pl.len()).collect().item()
+    if count:
+        print(f"\nFound {count} items.")
         print("Details of the first item (if any):")
-        print(json.dumps(output_data[0], indent=4))
-
-        # Convert output_data to DataFrame
-        df = pd.DataFrame(output_data)
-        
-
-        # Reorder the DataFrame columns
-        final_ordered_columns = list(COLUMN_MAPPING.values()) + ['batch_id']
-        df = df[final_ordered_columns]
+        print(json.dumps(metadata.head(1).collect().row(0, named=True), indent=4))
 
-        # Save the output_data to 'metadata.csv'
-        output_file_path = os.path.join(DATA_DIR, 'metadata.csv')
+        # Columns are in the order of COLUMN_MAPPING, followed by batch_id
         try:
-            df.to_csv(output_file_path, index=False, encoding='utf-8')
+            sink_frame(metadata, output_file_path, OUTPUT_FORMAT)
             print(f"\nOutput successfully written to {output_file_path}")
         except IOError as e:
             print(f"\nError writing output to {output_file_path}: {e}")
@@ -0,0 +1,193 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+import polars as pl
+from decoders import detect_format, get_backend, iter_lines, make_decoder, open_document
+from manifest import (
+    config_key,
+    hash_file,
+    is_unchanged,
+    load_manifest,
+    make_entry,
+    prune_outputs,
+    save_manifest,
+)
+from schemas import SCHEMA_VERSION, columns_frame, mapped_types, records_frame
+
+INPUT_EXTENSIONS = ('.json', '.jsonl')
+
+
+def find_input_files(data_dir):
+    """Recursively collect all .json and .jsonl files under data_dir in a single directory walk."""
+    input_files = []
+    for root, dirs, files in os.walk(data_dir):
+        # Match glob semantics: hidden directories and files are skipped
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if name.endswith(INPUT_EXTENSIONS) and not name.startswith('.'):
+                input_files.append(os.path.join(root, name))
+    return input_files
+
+
+def get_batch_id(file_path):
+    # Extract batch_id from filename
+    basename = os.path.basename(file_path)
+    return os.path.splitext(basename)[0]
+
+
+def read_items(file_path, fields=None):
+    """
+    Parse a .json or .jsonl delivery file into a list of raw items.
+
+    The format is detected from the content, so a .json file that is really JSONL is only
+    decoded once. With `fields`, items only keep those keys.
+    """
+    backend = get_backend(projected=fields is not None)
+    decode = make_decoder(fields, backend)
+    try:
+        with open(file_path, 'rb') as f:
+            if detect_format(f, decode) == 'document':
+                try:
+                    with open_document(f, backend) as data:
+                        content = decode(data)
+                    if isinstance(content, list):
+                        return content
+                    elif isinstance(content, dict): # Handle case where a .json file might contain a single object
+                        return [content]
+                    print(f"Skipping file {file_path}: content is not a list or dict of JSON objects.")
+                    return []
+                except ValueError as e_file:
+                    print(f"Skipping file {file_path} due to JSON decode error: {e_file}")
+                    print(f"Attempting to read {file_path} as JSONL...")
+                    f.seek(0)
+
+            # JSONL is decoded line by line, so only one record is in memory at a time
+            items = []
+            for line in iter_lines(f):
+                try:
+                    items.append(decode(line))
+                except ValueError as e_line:
+                    print(f"Skipping line in {file_path} due to JSON decode error: {e_line}")
+            return items
+    except Exception as e:
+        print(f"Could not read or process file {file_path}: {e}")
+        return []
+
+
+def map_files(func, input_files, workers=None):
+    """
+    Apply func to every file over a process pool, yielding (file_path, result) in input order.
+
+    Only a bounded window of files is in flight at once, so results are never buffered for
+    the whole directory when the consumer is slower than the workers.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(input_files) <= 1:
+        for file_path in input_files:
+            yield file_path, func(file_path)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        remaining = iter(input_files)
+        pending = deque(
+            (file_path, executor.submit(func, file_path))
+            for file_path in islice(remaining, workers * 2)
+        )
+        while pending:
+            file_path, future = pending.popleft()
+            next_path = next(remaining, None)
+            if next_path is not None:
+                pending.append((next_path, executor.submit(func, next_path)))
+            yield file_path, future.result()
+
+
+def process_file_frame(file_path, column_mapping):
+    """
+    Read a single delivery file straight into a typed frame, without building a dict per item.
+
+    Values are appended to one list per column, which Polars turns into columns directly. The
+    frame has no batch_id column; it is added when the file is scanned.
+    """
+    columns = {new_key: [] for new_key in column_mapping.values()}
+    for item in read_items(file_path, fields=column_mapping):
+        if not isinstance(item, dict):
+            print(f"Skipping non-dictionary item in {file_path}: {item}")
+            continue
+        for original_key, new_key in column_mapping.items():
+            columns[new_key].append(item.get(original_key))
+    return columns_frame(columns, mapped_types(column_mapping))
+
+
+def load_or_process_frame(file_path, column_mapping, manifest_dir, manifest):
+    """Return (manifest entry, cache hit) for a file, writing its frame as Parquet on a miss."""
+    stat = os.stat(file_path)
+    entry = manifest.get(os.path.abspath(file_path))
+    if not (is_unchanged(entry, stat) and os.path.exists(os.path.join(manifest_dir, entry['output']))):
+        content_hash = hash_file(file_path)
+        entry = make_entry(stat, content_hash, f"{content_hash}.parquet")
+
+    output_path = os.path.join(manifest_dir, entry['output'])
+    if os.path.exists(output_path):
+        return entry, True
+
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    process_file_frame(file_path, column_mapping).write_parquet(tmp_path)
+    os.replace(tmp_path, output_path)
+    return entry, False
+
+
+def scan_file_frame(path, batch_id):
+    # Identical content may be cached under another file name, so batch_id is never stored
+    return pl.scan_parquet(path).with_columns(pl.lit(batch_id, dtype=pl.Utf8).alias('batch_id'))
+
+
+def scan_processed_files(data_dir, column_mapping, workers=None, cache_dir=None) -> pl.LazyFrame:
+    """
+    Lazily scan the mapped items of every delivery file under data_dir as one frame.
+
+    With a cache_dir, each file is stored once as a Parquet frame next to a manifest, and later
+    runs only parse new or changed files. Columns follow output_columns(column_mapping) with the dtypes of the schema registry.
+    """
+    input_files = find_input_files(data_dir)
+    empty = records_frame([], output_columns(column_mapping), mapped_types(column_mapping)).lazy()
+    if cache_dir is None:
+        frames = []
+        for file_path, frame in map_files(partial(process_file_frame, column_mapping=column_mapping), input_files, workers):
+            print(f"Processing file: {file_path}")
+            frames.append(frame.lazy().with_columns(pl.lit(get_batch_id(file_path), dtype=pl.Utf8).alias('batch_id')))
+        return pl.concat([empty, *frames])
+
+    manifest_dir = os.path.join(cache_dir, config_key({
+        'column_mapping': column_mapping,
+        'data_dir': os.path.abspath(data_dir),
+        'format': 'parquet',
+        'schema': SCHEMA_VERSION,
+    }))
+    os.makedirs(manifest_dir, exist_ok=True)
+    manifest = load_manifest(manifest_dir)
+    func = partial(load_or_process_frame, column_mapping=column_mapping, manifest_dir=manifest_dir, manifest=manifest)
+
+    new_manifest = {}
+    cache_hits = 0
+    for file_path, (entry, cache_hit) in map_files(func, input_files, workers):
+        new_manifest[os.path.abspath(file_path)] = entry
+        if cache_hit:
+            cache_hits += 1
+        else:
+            print(f"Processing file: {file_path}")
+    save_manifest(manifest_dir, new_manifest)
+    prune_outputs(manifest_dir, new_manifest)
+    print(f"Reused cached output for {cache_hits} of {len(input_files)} files.")
+
+    frames = [
+        scan_file_frame(os.path.join(manifest_dir, new_manifest[os.path.abspath(file_path)]['output']), get_batch_id(file_path))
+        for file_path in input_files
+    ]
+    return pl.concat([empty, *frames])
+
+
+def output_columns(column_mapping):
+    return list(column_mapping.values()) + ['batch_id']
+
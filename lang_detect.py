@@ -0,0 +1,155 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import polars as pl
+from dotenv import load_dotenv
+
+from sinks import atomic_path
+from text_hash import content_hash
+
+try:
+    from langdetect import DetectorFactory, detect
+    from langdetect.lang_detect_exception import LangDetectException
+except ImportError:
+    detect = None
+
+TAG_PATTERN = r"<[/]?\w+>"
+NON_ASCII_PATTERN = r"[^\x00-\x7F]"
+EMPTY = "EMPTY"
+UNKNOWN = "idk"
+# Text column -> language column of the gym prompt dumps
+LANG_COLUMNS = {"prompt": "lang", "title": "lang_title"}
+CACHE_NAME = "languages.parquet"
+# Texts sent to a worker at a time
+CHUNK_SIZE = 64
+
+
+def seed_detector():
+    # langdetect is randomized; a fixed seed makes results reproducible, which the cache relies on
+    DetectorFactory.seed = 0
+
+
+def detect_language(text: str) -> str:
+    try:
+        return detect(text)
+    except LangDetectException:
+        return UNKNOWN
+
+
+def detect_all(texts: list, workers=None) -> list:
+    """Run langdetect over texts in a process pool, in input order."""
+    if detect is None:
+        raise ImportError("Language detection needs langdetect: pip install langdetect")
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(texts) <= CHUNK_SIZE:
+        seed_detector()
+        return [detect_language(text) for text in texts]
+    with ProcessPoolExecutor(max_workers=workers, initializer=seed_detector) as executor:
+        return list(executor.map(detect_language, texts, chunksize=CHUNK_SIZE))
+
+
+def load_cache(cache_path) -> dict:
+    if cache_path is None or not os.path.exists(cache_path):
+        return {}
+    cache = pl.read_parquet(cache_path)
+    return dict(zip(cache.get_column("hash"), cache.get_column("lang")))
+
+
+def save_cache(cache_path, cache: dict):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with atomic_path(cache_path) as tmp_path:
+        pl.DataFrame({"hash": list(cache), "lang": list(cache.values())}, schema={"hash": pl.Utf8, "lang": pl.Utf8}).write_parquet(tmp_path)
+
+
+def stripped(column: str) -> pl.Expr:
+    return pl.col(column).fill_null("").str.replace_all(TAG_PATTERN, "")
+
+
+def add_languages(df: pl.DataFrame, columns=LANG_COLUMNS, cache_path=None, workers=None) -> pl.DataFrame:
+    """
+    Add a language column per text column, e.g. "lang" for "prompt".
+
+    Tags are removed first; empty text is EMPTY. ASCII-only text is taken as English without
+    running detection, which settles most rows with one vectorized check. Only the distinct
+    remaining texts are detected, over a process pool, and their results are cached by content
+    hash, so texts seen in earlier runs or other dumps are never detected again.
+    """
+    candidates = pl.concat(
+        [
+            df.select(stripped(column).alias("text")).filter(
+                (pl.col("text") != "") & pl.col("text").str.contains(NON_ASCII_PATTERN)
+            )
+            for column in columns
+            if column in df.columns
+        ]
+        or [pl.DataFrame(schema={"text": pl.Utf8})]
+    ).unique(maintain_order=True).get_column("text").to_list()
+
+    cache = load_cache(cache_path)
+    hashes = [content_hash(text) for text in candidates]
+    missing = [text for text, text_hash in zip(candidates, hashes) if text_hash not in cache]
+    if missing:
+        print(f"Detecting the language of {len(missing)} of {len(candidates)} distinct non-ASCII texts...")
+        cache.update(zip(map(content_hash, missing), detect_all(missing, workers)))
+        if cache_path is not None:
+            save_cache(cache_path, cache)
+    langs = [cache[text_hash] for text_hash in hashes]
+
+    return df.with_columns(
+        pl.when(stripped(column) == "")
+        .then(pl.lit(EMPTY))
+        .when(~stripped(column).str.contains(NON_ASCII_PATTERN))
+        .then(pl.lit("en"))
+        .otherwise(stripped(column).replace_strict(candidates, langs, default=UNKNOWN, return_dtype=pl.Utf8))
+        .alias(lang_column)
+        for column, lang_column in columns.items()
+        if column in df.columns
+    )
+
+
+def is_english() -> pl.Expr:
+    """The en split: English or empty prompt, or English title. Embedded iframes (no real text) count as English."""
+    return (
+        pl.col("lang").is_in(["en", EMPTY])
+        | (pl.col("lang_title") == "en")
+        | pl.col("prompt").str.contains("iframe src=", literal=True).fill_null(False)
+    )
+
+
+def split_file(file_path, output_dir, cache_path=None, workers=None):
+    """Write <stem>_en.jsonl and <stem>_non_en.jsonl for a prompt dump; returns the row count of each."""
+    df = add_languages(pl.read_ndjson(file_path), cache_path=cache_path, workers=workers)
+    parts = df.with_columns(pl.when(is_english()).then(pl.lit("en")).otherwise(pl.lit("non_en")).alias("split")).partition_by(
+        "split", as_dict=True, include_key=False
+    )
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    os.makedirs(output_dir, exist_ok=True)
+    counts = {}
+    for split in ["en", "non_en"]:
+        part = parts.get((split,), df.clear())
+        with atomic_path(os.path.join(output_dir, f"{stem}_{split}.jsonl")) as tmp_path:
+            part.write_ndjson(tmp_path)
+        counts[split] = part.height
+    return counts
+
+
+def main():
+    load_dotenv(override=True)
+    DATA_DIR = os.getenv("DATA_DIR", "./data")
+
+    parser = argparse.ArgumentParser(description="Split gym prompt dumps into English and non-English prompts")
+    parser.add_argument("files", nargs="+", help="Prompt dump .jsonl files, e.g. data/gym/dump_prompt_solution_gym_0605_b.jsonl")
+    parser.add_argument("--output-dir", default=os.path.join(DATA_DIR, "op"), help="Where the splits are written (default: DATA_DIR/op)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: all CPUs)")
+    args = parser.parse_args()
+
+    cache_path = os.path.join(DATA_DIR, ".lang_cache", CACHE_NAME)
+    for file_path in args.files:
+        counts = split_file(file_path, args.output_dir, cache_path, args.workers)
+        total = counts["en"] + counts["non_en"]
+        print(f"{file_path}: {total} rows, English/Empty: {counts['en']}, Non-English: {counts['non_en']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def hash_file(file_path, chunk_size=1 << 20):
+    """Content hash of a file, read in chunks so large deliveries are never fully loaded."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def config_key(config):
+    """Short stable key for the processing config, so outputs of different mappings never mix."""
+    encoded = json.dumps(config, sort_keys=True).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+
+def load_manifest(manifest_dir):
+    manifest_path = os.path.join(manifest_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Ignoring unreadable manifest {manifest_path}: {e}")
+        return {}
+
+
+def save_manifest(manifest_dir, manifest):
+    os.makedirs(manifest_dir, exist_ok=True)
+    manifest_path = os.path.join(manifest_dir, MANIFEST_NAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def is_unchanged(entry, stat):
+    """Cheap check: a file whose size and mtime match its manifest entry is not re-hashed."""
+    return (
+        entry is not None
+        and entry.get('size') == stat.st_size
+        and entry.get('mtime') == stat.st_mtime_ns
+    )
+
+
+def make_entry(stat, content_hash, output):
+    return {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        'hash': content_hash,
+        'output': output,
+    }
+
+
+def prune_outputs(manifest_dir, manifest, keep=(MANIFEST_NAME,)):
+    """Delete cached outputs that are no longer referenced by any manifest entry."""
+    referenced = {entry['output'] for entry in manifest.values()}
+    referenced.update(keep)
+    for name in os.listdir(manifest_dir):
+        if name not in referenced and not name.endswith('.tmp'):
+            os.remove(os.path.join(manifest_dir, name))
@@ -0,0 +1,235 @@
+import argparse
+import json
+import os
+import re
+from collections import defaultdict
+
+from decoders import NON_WHITESPACE, detect_format, first_byte, get_backend, make_decoder, msgspec, open_document
+from ingest import find_input_files
+from sinks import atomic_writer
+
+# Parts of a split delivery, e.g. "RLMF 25062025_24_V2_50_1.json" and "..._50_2.json" for "RLMF 25062025_24_V2_50"
+SIBLING_PATTERN = re.compile(r"^(?P<base>.+_V\d+_\d+)_(?P<part>[1-9]\d?)\.(?P<ext>json|jsonl)$")
+MAX_PARTS = 99
+TASK_ID = "task id"
+
+
+def find_sibling_groups(paths) -> dict:
+    """
+    Group split delivery files by the batch they belong to, as {merged path: [part paths in order]}.
+
+    Directories are searched recursively. The merged file goes next to the parts and takes the
+    extension of the first part.
+    """
+    files = []
+    for path in paths:
+        files.extend(find_input_files(path) if os.path.isdir(path) else [path])
+
+    parts = defaultdict(dict)
+    for file_path in files:
+        match = SIBLING_PATTERN.match(os.path.basename(file_path))
+        if match:
+            base = os.path.join(os.path.dirname(file_path), match.group("base"))
+            parts[base][int(match.group("part"))] = file_path
+
+    groups = {}
+    for base, numbered in sorted(parts.items()):
+        if sorted(numbered) != list(range(1, len(numbered) + 1)):
+            print(f"Skipping {base}: parts {sorted(numbered)} are not numbered 1 to {len(numbered)}.")
+            continue
+        if len(numbered) == 1:
+            print(f"Skipping {base}: only part 1 was found.")
+            continue
+        ordered = [numbered[part] for part in sorted(numbered)]
+        groups[base + os.path.splitext(ordered[0])[1]] = ordered
+    return groups
+
+
+def iter_numbered_records(file_path):
+    """
+    Yield (number, encoded JSON) for every record of a .json or .jsonl delivery, one record at a time.
+
+    `number` is the line number of a JSONL record and the position of a record in a JSON array,
+    for error messages. JSONL is read line by line. A JSON array is split into records with msgspec straight from a
+    memory mapping, so neither the file nor its decoded records are ever held in memory. Without
+    msgspec, or for input msgspec rejects (e.g. NaN), the array is decoded at once and its records
+    re-encoded.
+    """
+    with open(file_path, "rb") as f:
+        if detect_format(f, make_decoder()) == "jsonl":
+            for number, line in enumerate(f, 1):
+                if NON_WHITESPACE.search(line):
+                    yield number, line.strip()
+            return
+
+        if msgspec is not None:
+            with open_document(f, "msgspec") as data:
+                if first_byte(data) != b"[":
+                    yield 1, bytes(data).strip()
+                    return
+                try:
+                    raws = msgspec.json.decode(data, type=list[msgspec.Raw])
+                except msgspec.DecodeError:
+                    raws = None
+                if raws is not None:
+                    for number, raw in enumerate(raws, 1):
+                        yield number, bytes(raw)
+                    return
+            f.seek(0)
+
+        content = make_decoder(backend="json")(f.read())
+        for number, item in enumerate(content if isinstance(content, list) else [content], 1):
+            yield number, json.dumps(item, ensure_ascii=False).encode("utf-8")
+
+
+def iter_raw_records(file_path):
+    """The encoded JSON of every record, see iter_numbered_records."""
+    for _, raw in iter_numbered_records(file_path):
+        yield raw
+
+
+def first_record_fields(file_path):
+    for raw in iter_raw_records(file_path):
+        try:
+            record = make_decoder()(raw)
+        except ValueError:
+            # Reported by merge_parts
+            continue
+        return list(record) if isinstance(record, dict) else None
+    return None
+
+
+def check_schemas(part_paths, relaxed=False):
+    """
+    Compare the fields of the first record of every part.
+
+    Parts with different fields are an error, unless `relaxed`, in which case the merged file
+    simply has records with different fields (like pl.concat(how="diagonal_relaxed")).
+    """
+    fields = {path: first_record_fields(path) for path in part_paths}
+    reference_path, reference = part_paths[0], fields[part_paths[0]]
+    for path, part_fields in fields.items():
+        if part_fields is None or reference is None or set(part_fields) == set(reference):
+            continue
+        missing = sorted(set(reference) - set(part_fields))
+        extra = sorted(set(part_fields) - set(reference))
+        message = f"{os.path.basename(path)} differs from {os.path.basename(reference_path)}: missing {missing}, extra {extra}"
+        if not relaxed:
+            raise ValueError(f"Error: Incompatible parts. {message}. Use --relaxed to merge them anyway.")
+        print(f"Warning: {message}")
+
+
+def merge_parts(part_paths, output_path, relaxed=False):
+    """
+    Concatenate the records of the parts into output_path, keeping the first record of every task id.
+
+    Records are copied as encoded, one at a time; only their task ids are decoded. Lines that are
+    not valid JSON are skipped with a warning, like the delivery scripts do. The output replaces an
+    existing file only once it is complete. Returns (records written, duplicates dropped).
+    """
+    check_schemas(part_paths, relaxed)
+    jsonl = output_path.endswith(".jsonl")
+    # A single record is small, so without msgspec it is simply decoded whole
+    decode_task_id = make_decoder(fields=[TASK_ID], backend="msgspec" if msgspec is not None else get_backend())
+    seen = set()
+    written = duplicates = 0
+
+    with atomic_writer(output_path, "wb") as out:
+        out.write(b"" if jsonl else b"[")
+        for part_path in part_paths:
+            for number, raw in iter_numbered_records(part_path):
+                try:
+                    record = decode_task_id(raw)
+                except ValueError as e:
+                    print(f"Skipping {part_path}:{number} due to JSON decode error: {e}")
+                    continue
+                task_id = record.get(TASK_ID) if isinstance(record, dict) else None
+                if task_id is not None:
+                    if str(task_id) in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(str(task_id))
+                if jsonl:
+                    # Records of a pretty-printed JSON part span several lines
+                    out.write((raw if b"\n" not in raw else json.dumps(make_decoder()(raw), ensure_ascii=False).encode("utf-8")) + b"\n")
+                else:
+                    out.write((b",\n" if written else b"\n") + raw)
+                written += 1
+        out.write(b"" if jsonl else (b"\n]" if written else b"]"))
+    return written, duplicates
+
+
+def positive_int(value) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def split_file(file_path, size, output_dir):
+    """
+    Split a delivery into parts of at most `size` records, named like split deliveries (<name>_1.json, ...).
+
+    Returns the part paths.
+    """
+    if size < 1:
+        raise ValueError(f"Error: The part size must be at least 1, got {size}.")
+    stem, ext = os.path.splitext(os.path.basename(file_path))
+    os.makedirs(output_dir, exist_ok=True)
+    jsonl = ext == ".jsonl"
+    paths = []
+    records = iter_raw_records(file_path)
+    raw = next(records, None)
+    while raw is not None:
+        if len(paths) == MAX_PARTS:
+            raise ValueError(f"Error: {file_path} needs more than {MAX_PARTS} parts of {size} records.")
+        path = os.path.join(output_dir, f"{stem}_{len(paths) + 1}{ext}")
+        with atomic_writer(path, "wb") as out:
+            out.write(b"" if jsonl else b"[")
+            count = 0
+            while raw is not None and count < size:
+                out.write(raw + b"\n" if jsonl else (b",\n" if count else b"\n") + raw)
+                count += 1
+                raw = next(records, None)
+            out.write(b"" if jsonl else b"\n]")
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge split deliveries (<name>_1.json, <name>_2.json, ...) or split a delivery into parts")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    merge = commands.add_parser("merge", help="Merge the parts of every split delivery found")
+    merge.add_argument("paths", nargs="+", help="Part files, or directories to search for them")
+    merge.add_argument("--relaxed", action="store_true", help="Merge parts even if their records have different fields")
+    merge.add_argument("--dry-run", action="store_true", help="Only list the groups that would be merged")
+
+    split = commands.add_parser("split", help="Split a delivery into parts")
+    split.add_argument("file", help="Delivery .json or .jsonl file")
+    split.add_argument("--size", type=positive_int, required=True, help="Records per part")
+    # Parts next to the original would be read alongside it by the delivery scripts
+    split.add_argument("--output-dir", required=True, help="Where the parts are written, outside the delivery directory")
+    args = parser.parse_args()
+
+    if args.command == "split":
+        paths = split_file(args.file, args.size, args.output_dir)
+        print(f"Split {args.file} into {len(paths)} parts.")
+        return
+
+    groups = find_sibling_groups(args.paths)
+    if not groups:
+        print("No split deliveries found.")
+    for output_path, part_paths in groups.items():
+        print(f"{output_path} <- {', '.join(os.path.basename(path) for path in part_paths)}")
+        if args.dry_run:
+            continue
+        written, duplicates = merge_parts(part_paths, output_path, args.relaxed)
+        print(f"Wrote {written} records ({duplicates} duplicate task ids dropped).")
+    if groups and not args.dry_run:
+        # The delivery scripts read every .json/.jsonl file, so the parts would be counted twice
+        print("Move the part files out of the data directory before running the delivery scripts.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import json
+import mmap
+
+import numpy as np
+import polars as pl
+
+from schemas import ANNOTATION_SCHEMA
+
+# Bytes scanned per numpy pass when looking for newlines
+CHUNK_SIZE = 64 * 1024 * 1024
+WHITESPACE = np.array([ord(" "), ord("\t"), ord("\r"), ord("\n")], dtype=np.uint8)
+
+
+def open_mmap(path: str) -> mmap.mmap:
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def build_line_index(mm: mmap.mmap) -> np.ndarray:
+    """
+    Byte offsets (start, end) of every non-blank line, as an (n, 2) array.
+
+    Blank lines are skipped like pl.read_ndjson does, so row i of the index is row i of the scan.
+    """
+    size = len(mm)
+    data = np.frombuffer(mm, dtype=np.uint8)
+    newlines = [np.flatnonzero(data[offset:offset + CHUNK_SIZE] == ord("\n")) + offset for offset in range(0, size, CHUNK_SIZE)]
+    ends = np.concatenate(newlines + [np.array([size])]).astype(np.int64)
+    starts = np.concatenate([np.array([0], dtype=np.int64), ends[:-1] + 1])
+
+    # Only empty lines and lines starting with whitespace can be blank, so only those are decoded
+    first_bytes = data[np.minimum(starts, size - 1)]
+    del data  # the mmap can't be closed while numpy holds a view on it
+    maybe_blank = np.flatnonzero((starts == ends) | np.isin(first_bytes, WHITESPACE))
+    blank = [i for i in maybe_blank if not mm[starts[i]:ends[i]].strip()]
+    return np.delete(np.column_stack([starts, ends]), blank, axis=0)
+
+
+def read_line(mm: mmap.mmap, line_index: np.ndarray, row: int) -> dict:
+    """Decode only the JSON record of one row."""
+    start, end = line_index[row]
+    return json.loads(mm[start:end])
+
+
+def scan_queue(path: str) -> pl.DataFrame:
+    """Decode the link and the Answer.data flags of every row, skipping the nested step data."""
+    return pl.scan_ndjson(path, schema=ANNOTATION_SCHEMA).collect()
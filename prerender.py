@@ -0,0 +1,103 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import polars as pl
+from dotenv import load_dotenv
+
+from constants import DATA_VALS
+from schemas import read_delivery, read_delivery_csv
+from utils import content_hash, render_text
+
+SIDECAR_SUFFIX = ".rendered.parquet"
+
+
+def sidecar_path(render_dir: str, file_name: str) -> str:
+    """Location of the pre-rendered markdown for an evaluations file, e.g. rendered/<stem>.rendered.parquet."""
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    return os.path.join(render_dir, stem + SIDECAR_SUFFIX)
+
+
+def read_evaluations(file_path: str) -> pl.DataFrame:
+    if file_path.endswith(".csv"):
+        return read_delivery_csv(file_path)
+    return read_delivery(file_path)
+
+
+def render_job(job):
+    text, field = job
+    return render_text(text, field)
+
+
+def prerender_frame(df: pl.DataFrame, workers=None) -> pl.DataFrame:
+    """
+    Run the clean_text pipeline over every DATA_VALS column of every row.
+
+    Returns one row per (task id, field) with the content hash of the source text, so identical
+    texts are rendered once and a stale sidecar can never be matched to edited text. The viewer
+    looks texts up by content hash alone, so uploads without a "task id" column are rendered too;
+    uploads without any DATA_VALS column give an empty sidecar.
+    """
+    id_columns = [pl.col("task id").cast(pl.Utf8)] if "task id" in df.columns else []
+    fields = [
+        df.select(
+            *id_columns,
+            pl.lit(name).alias("field"),
+            pl.col(name).cast(pl.Utf8).alias("text"),
+        )
+        for name in DATA_VALS
+        if name in df.columns
+    ]
+    if not fields:
+        return pl.DataFrame(schema={"field": pl.Utf8, "content_hash": pl.Utf8, "rendered": pl.Utf8})
+    long_df = pl.concat(fields).filter(pl.col("text").is_not_null() & (pl.col("text") != ""))
+    long_df = long_df.with_columns(
+        pl.Series("content_hash", [content_hash(text) for text in long_df.get_column("text")], dtype=pl.Utf8)
+    )
+
+    jobs = long_df.unique(subset=["content_hash", "field"], maintain_order=True)
+    job_args = list(zip(jobs.get_column("text"), jobs.get_column("field")))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        rendered = list(executor.map(render_job, job_args, chunksize=32))
+    rendered_df = jobs.select("content_hash", "field").with_columns(pl.Series("rendered", rendered, dtype=pl.Utf8))
+
+    return long_df.drop("text").join(rendered_df, on=["content_hash", "field"], how="left")
+
+
+def prerender_file(file_path: str, render_dir: str, workers=None) -> str:
+    print(f"Rendering file: {file_path}")
+    rendered_df = prerender_frame(read_evaluations(file_path), workers)
+
+    os.makedirs(render_dir, exist_ok=True)
+    output_path = sidecar_path(render_dir, file_path)
+    tmp_path = output_path + ".tmp"
+    rendered_df.write_parquet(tmp_path)
+    os.replace(tmp_path, output_path)
+    print(f"Wrote {rendered_df.height} rendered fields to {output_path}")
+    return output_path
+
+
+def read_prerendered(paths) -> dict:
+    """Load sidecar files into a {(content hash, field): rendered markdown} lookup for clean_text."""
+    prerendered = {}
+    for path in paths:
+        df = pl.read_parquet(path, columns=["content_hash", "field", "rendered"])
+        prerendered.update(zip(zip(df.get_column("content_hash"), df.get_column("field")), df.get_column("rendered")))
+    return prerendered
+
+
+def main():
+    load_dotenv(override=True)
+    DATA_DIR = os.getenv("DATA_DIR", "./data")
+
+    parser = argparse.ArgumentParser(description="Pre-render the markdown shown by view_evaluations.py")
+    parser.add_argument("files", nargs="+", help="Evaluation .json or .csv files, as uploaded to the viewer")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: all CPUs)")
+    args = parser.parse_args()
+
+    for file_path in args.files:
+        prerender_file(file_path, os.path.join(DATA_DIR, "rendered"), args.workers)
+
+
+if __name__ == "__main__":
+    main()
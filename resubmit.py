@@ -0,0 +1,119 @@
+import argparse
+import os
+
+import polars as pl
+from dotenv import load_dotenv
+
+from constants import COLUMN_MAPPING
+from corpus_store import scan_corpus
+from rules import apply_rule
+from sinks import atomic_path
+
+# Id columns of the sources, in order of preference: annotation exports use "id", label files "question_id"
+ID_COLUMNS = ["id", "question_id"]
+# Ids are joined as strings, since exports and deliveries disagree on their type (60081 vs "60081")
+KEY = "__id"
+
+
+def scan_source(path) -> pl.LazyFrame:
+    """A .jsonl annotation export is scanned lazily; a .json label file (one array) is read at once."""
+    if path.endswith(".jsonl"):
+        return pl.scan_ndjson(path)
+    return pl.read_json(path).lazy()
+
+
+def id_column(lf: pl.LazyFrame) -> str:
+    columns = lf.collect_schema().names()
+    for column in ID_COLUMNS:
+        if column in columns:
+            return column
+    raise ValueError(f"No id column found, expected one of: {', '.join(ID_COLUMNS)}")
+
+
+def id_keys(lf: pl.LazyFrame, column=None) -> pl.LazyFrame:
+    column = column or id_column(lf)
+    return lf.select(pl.col(column).cast(pl.Utf8).alias(KEY)).unique()
+
+
+def join_ids(lf: pl.LazyFrame, ids: pl.LazyFrame, how, column=None, ids_column=None) -> pl.LazyFrame:
+    column = column or id_column(lf)
+    return (
+        lf.with_columns(pl.col(column).cast(pl.Utf8).alias(KEY))
+        .join(id_keys(ids, ids_column), on=KEY, how=how)
+        .drop(KEY)
+    )
+
+
+def keep_ids(lf, ids, column=None, ids_column=None) -> pl.LazyFrame:
+    """Rows of `lf` whose id occurs in `ids` (semi join)."""
+    return join_ids(lf, ids, "semi", column, ids_column)
+
+
+def drop_ids(lf, ids, column=None, ids_column=None) -> pl.LazyFrame:
+    """Rows of `lf` whose id does not occur in `ids` (anti join)."""
+    return join_ids(lf, ids, "anti", column, ids_column)
+
+
+def resubmission_set(annotations: pl.LazyFrame, corpus: pl.LazyFrame, reinjected=()) -> pl.LazyFrame:
+    """
+    Annotation rows of questions matching the "resubmit" rule in the corpus, minus the ones reinjected already.
+
+    Each id only appears once, in the order of the annotation source.
+    """
+    candidates = apply_rule(corpus, "resubmit", COLUMN_MAPPING).select("question_id")
+    lf = keep_ids(annotations, candidates, ids_column="question_id")
+    for source in reinjected:
+        lf = drop_ids(lf, source)
+    return lf.unique(subset=[id_column(annotations)], keep="first", maintain_order=True)
+
+
+def write_ndjson(df: pl.DataFrame, path):
+    with atomic_path(path) as tmp_path:
+        df.write_ndjson(tmp_path)
+
+
+def write_chunks(df: pl.DataFrame, output_dir, name, chunk_size) -> list:
+    """Split into <name>_part<k>.jsonl files of at most chunk_size rows each."""
+    paths = []
+    for part, chunk in enumerate(df.iter_slices(n_rows=chunk_size), start=1):
+        path = os.path.join(output_dir, f"{name}_part{part}.jsonl")
+        write_ndjson(chunk, path)
+        paths.append(path)
+    return paths
+
+
+def main():
+    load_dotenv(override=True)
+    DATA_DIR = os.getenv("DATA_DIR", "./data")
+
+    parser = argparse.ArgumentParser(description="Build the set of abandoned questions to send for annotation again")
+    parser.add_argument("annotations", help="Annotation export .jsonl with the questions, e.g. data/0515.annotation.jsonl")
+    parser.add_argument("--reinjected", nargs="*", default=[], help="Exports or label files of questions that were already resubmitted")
+    parser.add_argument("--name", default="resubmit", help="Output name, written as DATA_DIR/<name>.jsonl (default: resubmit)")
+    parser.add_argument("--head", type=int, help="Also write the first N rows as <name>_<N>.jsonl, e.g. 200")
+    parser.add_argument("--chunk-size", type=int, help="Also split the output into <name>_part<k>.jsonl files of N rows")
+    args = parser.parse_args()
+
+    store_dir = os.path.join(DATA_DIR, "corpus")
+    if not os.path.isdir(store_dir):
+        raise ValueError(f"Error: Corpus store '{store_dir}' not found. Build it first with `python corpus_store.py`.")
+
+    corpus = scan_corpus(store_dir, columns=["question_id", "abandon_prompt", "acc"])
+    lf = resubmission_set(scan_source(args.annotations), corpus, [scan_source(path) for path in args.reinjected])
+    # Streaming keeps only the matching rows in memory, not the whole annotation export
+    resubmit = lf.collect(engine="streaming")
+
+    output_file_path = os.path.join(DATA_DIR, f"{args.name}.jsonl")
+    write_ndjson(resubmit, output_file_path)
+    print(f"{resubmit.height} questions written to {output_file_path}")
+    if args.head:
+        head_path = os.path.join(DATA_DIR, f"{args.name}_{args.head}.jsonl")
+        write_ndjson(resubmit.head(args.head), head_path)
+        print(f"First {min(args.head, resubmit.height)} written to {head_path}")
+    if args.chunk_size:
+        paths = write_chunks(resubmit, DATA_DIR, args.name, args.chunk_size)
+        print(f"Split into {len(paths)} files of up to {args.chunk_size} rows")
+
+
+if __name__ == "__main__":
+    main()
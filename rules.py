@@ -0,0 +1,96 @@
+import json
+import os
+from functools import lru_cache
+
+import polars as pl
+
+from survivors import keep_survivors
+
+# Case selection rules (e.g. "effective"), shared by the delivery scripts, the notebooks and the viewer
+RULES_FILE = os.getenv("RULES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json"))
+
+COMPARISONS = {
+    "eq": lambda col, value: col == value,
+    "ne": lambda col, value: col != value,
+    "gt": lambda col, value: col > value,
+    "ge": lambda col, value: col >= value,
+    "lt": lambda col, value: col < value,
+    "le": lambda col, value: col <= value,
+    "in": lambda col, value: col.is_in(value),
+    "not_in": lambda col, value: ~col.is_in(value),
+}
+
+
+@lru_cache(maxsize=None)
+def load_rules(path=RULES_FILE) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_rule(name, path=RULES_FILE) -> dict:
+    rules = load_rules(path)
+    if name not in rules:
+        raise ValueError(f"Unknown rule '{name}' in {path}, expected one of: {', '.join(rules)}")
+    return rules[name]
+
+
+def column_name(field, column_mapping=None) -> str:
+    """Rules use the delivery field names; frames with mapped names (e.g. "task_id") pass their mapping."""
+    return (column_mapping or {}).get(field, field)
+
+
+def condition_expr(condition, column_mapping=None) -> pl.Expr:
+    """
+    Compile one condition, e.g. {"column": "intervention rounds", "op": "gt", "value": 0}.
+
+    Numeric values compare against the column cast to a number, so "2" and 2 match alike.
+    String values compare against the column as a string, lowercased with "ignore_case".
+    Rows where the column is missing or doesn't parse never match.
+    """
+    op = condition["op"]
+    col = pl.col(column_name(condition["column"], column_mapping))
+    if op == "is_null":
+        return col.is_null()
+    if op == "is_not_null":
+        return col.is_not_null()
+    if op not in COMPARISONS:
+        raise ValueError(f"Unknown operator '{op}', expected one of: is_null, is_not_null, {', '.join(COMPARISONS)}")
+
+    value = condition["value"]
+    values = value if isinstance(value, list) else [value]
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        col = col.cast(pl.Float64, strict=False)
+    else:
+        col = col.cast(pl.Utf8)
+        if condition.get("ignore_case"):
+            col = col.str.to_lowercase()
+            value = [str(v).lower() for v in values] if isinstance(value, list) else str(value).lower()
+    return COMPARISONS[op](col, value).fill_null(False)
+
+
+def rule_expr(name, column_mapping=None, path=RULES_FILE) -> pl.Expr:
+    """A single boolean expression for the rule: all conditions hold and the task is not denylisted."""
+    rule = get_rule(name, path)
+    exprs = [condition_expr(condition, column_mapping) for condition in rule.get("conditions", [])]
+    deny_task_ids = list(rule.get("deny_task_ids", {}))
+    if deny_task_ids:
+        task_id = pl.col(column_name("task id", column_mapping)).cast(pl.Utf8)
+        exprs.append(~task_id.is_in(deny_task_ids).fill_null(False))
+    return pl.all_horizontal(exprs) if exprs else pl.lit(True)
+
+
+def dedup_keys(name, column_mapping=None, path=RULES_FILE) -> list:
+    return [column_name(field, column_mapping) for field in get_rule(name, path).get("dedup_keys", [])]
+
+
+def apply_rule(frame, name, column_mapping=None, dedup=False, path=RULES_FILE):
+    """
+    Filter a DataFrame or LazyFrame by the rule in one pass.
+
+    With `dedup`, one row per dedup key (e.g. task id) is kept, chosen by survivors.survivor_order.
+    """
+    frame = frame.filter(rule_expr(name, column_mapping, path))
+    keys = dedup_keys(name, column_mapping, path)
+    if dedup and keys:
+        frame = keep_survivors(frame, keys)
+    return frame
@@ -0,0 +1,128 @@
+import json
+
+import polars as pl
+
+from constants import COLUMN_MAPPING, DATA_INFO, DATA_VALS
+
+# Bump when a field or dtype changes, so caches built with the old schema are rebuilt
+SCHEMA_VERSION = 2
+
+# Fields with a non-string type; everything else, including ids, is a string
+FIELD_TYPES = {
+    "ACC": pl.Float64,
+    "temperature": pl.Float64,
+    "total_tokens": pl.Int64,
+    "total_latency (ms)": pl.Float64,
+    "intervention rounds": pl.Int64,
+}
+
+# Target dtypes of every known delivery field, by delivery name (e.g. "task id")
+DELIVERY_SCHEMA = {
+    field: FIELD_TYPES.get(field, pl.Utf8)
+    for field in dict.fromkeys([*COLUMN_MAPPING, *DATA_INFO, *DATA_VALS])
+}
+
+# Fields of the annotation exports read by domestic_queue.py for stats and search
+ANNOTATION_SCHEMA = {
+    "link": pl.Utf8,
+    "Answer": pl.Struct({"data": pl.Struct({"fake_abandon": pl.Utf8, "cot_qualify": pl.Utf8})}),
+}
+
+
+def mapped_types(column_mapping) -> dict:
+    """FIELD_TYPES under the normalized names of a column mapping (e.g. "acc" instead of "ACC")."""
+    return {column_mapping[field]: dtype for field, dtype in FIELD_TYPES.items() if field in column_mapping}
+
+
+def records_frame(records, columns, column_types) -> pl.DataFrame:
+    """Build a frame with fixed dtypes from records whose value types drift between batches."""
+    return columns_frame({col: [r.get(col) for r in records] for col in columns}, column_types)
+
+
+def text_value(value):
+    """
+    A delivery value for a string column.
+
+    Ids and numbers become strings (60081 and "60081" are the same id). Nested values, such as
+    remarks delivered as an object, are kept as their JSON instead of a Python repr.
+    """
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def without_surrogates(value):
+    # Lone surrogates (e.g. an unpaired "\ud800" escape) can't be encoded as UTF-8; they become U+FFFD
+    if not isinstance(value, str):
+        return value
+    return value.encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+
+
+def text_series(name, values) -> pl.Series:
+    try:
+        return pl.Series(name, values, dtype=pl.Utf8)
+    except UnicodeEncodeError:
+        return pl.Series(name, [without_surrogates(value) for value in values], dtype=pl.Utf8)
+
+
+def columns_frame(columns, column_types) -> pl.DataFrame:
+    """Like records_frame, from values that were already collected column by column."""
+    series = []
+    for col, values in columns.items():
+        if col in column_types:
+            # Numeric fields drift between batches (e.g. ACC as "0.5" vs 0.5), so they are parsed from strings
+            numbers = text_series(col, [None if value is None else str(value) for value in values])
+            series.append(numbers.cast(pl.Float64, strict=False).cast(column_types[col], strict=False))
+        else:
+            series.append(text_series(col, [text_value(value) for value in values]))
+    return pl.DataFrame(series)
+
+
+def read_schema(schema=DELIVERY_SCHEMA) -> dict:
+    """
+    The schema deliveries are parsed with.
+
+    Every field is read as a string, because batches disagree on types (ACC as "0.5" vs 0.5, ids
+    as 60081 vs "60081") and Polars fails on a value that doesn't match a numeric dtype.
+    """
+    return {field: pl.Utf8 for field in schema}
+
+
+def coerce_exprs(schema=DELIVERY_SCHEMA, columns=None) -> list:
+    """Cast string columns to their target dtypes; values that don't parse become null."""
+    return [
+        pl.col(field).cast(pl.Float64, strict=False).cast(dtype, strict=False)
+        for field, dtype in schema.items()
+        if dtype != pl.Utf8 and (columns is None or field in columns)
+    ]
+
+
+def read_delivery(source, schema=DELIVERY_SCHEMA) -> pl.DataFrame:
+    """
+    Read a delivery .json file without schema inference, with consistent dtypes across batches.
+
+    Fields that are not part of the schema are dropped, missing fields are null. Polars can't read
+    a nested value (e.g. remarks as an object) as a string, so such files are decoded in Python
+    and built like the ingest frames, with nested values as JSON.
+    """
+    try:
+        return pl.read_json(source, schema=read_schema(schema)).with_columns(coerce_exprs(schema))
+    except pl.exceptions.ComputeError:
+        if hasattr(source, "seek"):
+            source.seek(0)
+            content = json.load(source)
+        else:
+            with open(source, "rb") as f:
+                content = json.load(f)
+    items = [item for item in (content if isinstance(content, list) else [content]) if isinstance(item, dict)]
+    return columns_frame(
+        {field: [item.get(field) for item in items] for field in schema},
+        {field: dtype for field, dtype in schema.items() if dtype != pl.Utf8},
+    )
+
+
+def read_delivery_csv(source, schema=DELIVERY_SCHEMA) -> pl.DataFrame:
+    df = pl.read_csv(source, infer_schema=False)
+    return df.with_columns(coerce_exprs(schema, df.columns))
@@ -0,0 +1,132 @@
+import re
+
+import polars as pl
+
+SEARCH_COLUMNS = ["user prompt", "response"]
+SNIPPET_WIDTH = 50
+
+# Quoted phrases are kept together, everything else is split on whitespace
+QUERY_TERM_PATTERN = re.compile(r'"([^"]+)"|(\S+)')
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def build_search_index(df, columns=SEARCH_COLUMNS) -> pl.DataFrame:
+    """
+    Build an inverted index over the lowercased words of the text columns.
+
+    `df` may be a DataFrame or a LazyFrame, e.g. a scan of a memory-mapped Arrow file, which is
+    then read in streaming batches. Returns one row per distinct word with the sorted row
+    positions that contain it.
+    """
+    df = df.lazy()
+    names = df.collect_schema().names()
+    postings = [
+        df.select(
+            pl.int_range(pl.len(), dtype=pl.UInt32).alias("row"),
+            pl.col(column).cast(pl.Utf8).str.to_lowercase().str.extract_all(r"\w+").list.unique().alias("token"),
+        )
+        .explode("token")
+        for column in columns
+        if column in names
+    ]
+    if not postings:
+        return pl.DataFrame(schema={"token": pl.Utf8, "rows": pl.List(pl.UInt32)})
+    return (
+        pl.concat(postings)
+        .drop_nulls("token")
+        .unique()
+        .group_by("token")
+        .agg(pl.col("row").sort().alias("rows"))
+        .collect(engine="streaming")
+    )
+
+
+def parse_query(query: str) -> list:
+    return [phrase or word for phrase, word in QUERY_TERM_PATTERN.findall(query)]
+
+
+def candidate_rows(index: pl.DataFrame, term: str):
+    """
+    Rows that may contain `term` as a substring: every word piece of the term must occur inside
+    some indexed word of the row. Returns None when the term has no word characters to narrow on.
+    """
+    candidates = None
+    for piece in WORD_PATTERN.findall(term.lower()):
+        rows = (
+            index.lazy()
+            .filter(pl.col("token").str.contains(piece, literal=True))
+            .select(pl.col("rows").explode().unique())
+            .collect()
+            .get_column("rows")
+        )
+        candidates = rows if candidates is None else candidates.filter(candidates.is_in(rows))
+    return candidates
+
+
+def first_match(text, terms):
+    """Offsets (start, end) of the earliest case-insensitive occurrence of any term in text."""
+    if not text:
+        return None
+    best = None
+    for term in terms:
+        match = re.search(re.escape(term), text, flags=re.IGNORECASE)
+        if match and (best is None or match.start() < best[0]):
+            best = (match.start(), match.end())
+    return best
+
+
+def search(index: pl.DataFrame, df: pl.DataFrame, query: str, page: int = 0, page_size: int = 20, columns=SEARCH_COLUMNS):
+    """
+    Find rows where every query term occurs in at least one of the text columns.
+
+    Returns the total number of matching rows and the hits of the requested page. Each hit has the
+    row position and, per column, the offsets of the first match for building snippets.
+    """
+    terms = parse_query(query)
+    columns = [column for column in columns if column in df.columns]
+    if not terms or not columns:
+        return 0, []
+
+    rows = None
+    for term in terms:
+        term_rows = candidate_rows(index, term)
+        if term_rows is not None:
+            rows = term_rows if rows is None else rows.filter(rows.is_in(term_rows))
+    if rows is None:
+        rows = pl.Series("rows", range(len(df)), dtype=pl.UInt32)
+
+    # Verify the candidates only; the index narrows on words, the terms are substrings
+    predicate = pl.all_horizontal(
+        pl.any_horizontal(
+            pl.col(column).str.contains_any([term], ascii_case_insensitive=True).fill_null(False)
+            for column in columns
+        )
+        for term in terms
+    )
+    matches = (
+        df.lazy()
+        .with_row_index("row")
+        .filter(pl.col("row").is_in(rows))
+        .filter(predicate)
+        .select("row")
+        .collect()
+        .get_column("row")
+        .sort()
+    )
+
+    page_rows = matches.slice(page * page_size, page_size).to_list()
+    hits = []
+    for row in page_rows:
+        offsets = {column: first_match(df.get_column(column).item(row), terms) for column in columns}
+        hits.append({"row": row, "offsets": offsets})
+    return len(matches), hits
+
+
+def make_snippet(text: str, offsets, width: int = SNIPPET_WIDTH) -> str:
+    """Cut a snippet of roughly 2 * width characters around a match."""
+    start = offsets[0]
+    if start > width and len(text) - start > width:
+        return f"...{text[start - width:start + width]}..."
+    elif start <= width:
+        return f"{text[:2 * width]}..."
+    return f"...{text[-2 * width:]}"
@@ -0,0 +1,89 @@
+import json
+import os
+from contextlib import contextmanager
+
+import polars as pl
+
+# File extension per output format, selected with the OUTPUT_FORMAT environment variable
+OUTPUT_FORMATS = {
+    "json": ".json",
+    "ndjson": ".jsonl",
+    "csv": ".csv",
+    "parquet": ".parquet",
+}
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    A temporary path next to `path`, moved into place once writing to it succeeded.
+
+    A crash mid-write leaves the previous output untouched instead of a truncated file.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextmanager
+def atomic_writer(path, mode="w"):
+    """Open a file through atomic_path."""
+    with atomic_path(path) as tmp_path:
+        if "b" in mode:
+            with open(tmp_path, mode) as f:
+                yield f
+        else:
+            with open(tmp_path, mode, encoding="utf-8", newline="") as f:
+                yield f
+
+
+def write_json(path, records) -> int:
+    """Stream records as a JSON array, formatted like json.dump(records, f, indent=4)."""
+    count = 0
+    with atomic_writer(path) as f:
+        f.write("[")
+        for record in records:
+            f.write(",\n    " if count else "\n    ")
+            f.write(json.dumps(record, indent=4).replace("\n", "\n    "))
+            count += 1
+        f.write("\n]" if count else "]")
+    return count
+
+
+def output_path(output_dir, name, output_format) -> str:
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', expected one of: {', '.join(OUTPUT_FORMATS)}")
+    return os.path.join(output_dir, name + OUTPUT_FORMATS[output_format])
+
+
+def sink_frame(lf: pl.LazyFrame, path, output_format) -> None:
+    """
+    Write a lazy frame to `path` without collecting it first.
+
+    CSV, NDJSON and Parquet are written by Polars' streaming sinks. JSON has no streaming sink,
+    so the frame is streamed to a temporary NDJSON file, which write_json then turns into the
+    layout of json.dump(indent=4) one record at a time.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', expected one of: {', '.join(OUTPUT_FORMATS)}")
+    if output_format == "json":
+        spool_path = f"{path}.{os.getpid()}.ndjson.tmp"
+        try:
+            lf.sink_ndjson(spool_path)
+            with open(spool_path, encoding="utf-8") as f:
+                write_json(path, (json.loads(line) for line in f))
+        finally:
+            if os.path.exists(spool_path):
+                os.remove(spool_path)
+        return
+    with atomic_path(path) as tmp_path:
+        if output_format == "csv":
+            lf.sink_csv(tmp_path)
+        elif output_format == "ndjson":
+            lf.sink_ndjson(tmp_path)
+        else:
+            lf.sink_parquet(tmp_path)
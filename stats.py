@@ -0,0 +1,51 @@
+import polars as pl
+
+from rules import rule_expr
+
+# Columns the "All Cases" statistics are broken down by, when present
+BREAKDOWN_COLUMNS = ["model name", "batch_id", "trainer id"]
+COUNT_STATS = ["total", "abandoned", "zero_interventions", "effective", "abandoned_and_no_interventions"]
+
+
+def case_stat_exprs(columns) -> list:
+    """
+    Aggregations behind the viewer's "All Cases" table, so all of them are computed in one pass.
+
+    Works in a plain `select` as well as in a `group_by(...).agg(...)`.
+    """
+    rounds = pl.col("intervention rounds")
+    total = pl.len().cast(pl.Int64)
+    # "abandoned" and "effective" are the rules in rules.json, the same ones the delivery scripts apply
+    abandoned = rule_expr("abandoned")
+    no_interventions = rounds == 0
+
+    exprs = [
+        total.alias("total"),
+        abandoned.sum().alias("abandoned"),
+        no_interventions.sum().alias("zero_interventions"),
+        rule_expr("effective").sum().alias("effective"),
+        (abandoned & no_interventions).sum().alias("abandoned_and_no_interventions"),
+    ]
+    if "ACC" in columns:
+        acc = pl.col("ACC").cast(pl.Float64, strict=False)
+        with_acc = acc.is_not_null()
+        nonzero_acc = with_acc & (acc > 0)
+        exprs += [
+            pl.corr(rounds.filter(with_acc), acc.filter(with_acc), method="pearson").alias("correlation"),
+            pl.corr(rounds.filter(nonzero_acc), acc.filter(nonzero_acc), method="pearson").alias("correlation w/o ACC = 0"),
+        ]
+    return exprs
+
+
+def case_stats(df: pl.DataFrame) -> dict:
+    """Counts and ACC correlations over all cases, as {stat: value}."""
+    return df.select(case_stat_exprs(df.columns)).row(0, named=True)
+
+
+def case_stats_by(df: pl.DataFrame, column: str) -> pl.DataFrame:
+    """The same statistics per value of `column`, one row per group."""
+    return df.group_by(column).agg(case_stat_exprs(df.columns)).sort(column, nulls_last=True)
+
+
+def case_breakdowns(df: pl.DataFrame) -> dict:
+    return {column: case_stats_by(df, column) for column in BREAKDOWN_COLUMNS if column in df.columns}
@@ -0,0 +1,37 @@
+import polars as pl
+
+# Position of a row before sorting, the last tie-breaker
+ROW = "row"
+
+
+def survivor_order(frame):
+    """
+    Sort rows so the survivor of every duplicate group comes first.
+
+    The newest delivery wins: the highest _V<version>_ (fixed deliveries replace the original),
+    then the highest batch number, then batch_id and the position of the row, so the result
+    never depends on how the rows were read.
+    """
+    batch_id = pl.col("batch_id")
+    return frame.sort(
+        [
+            batch_id.str.extract(r"_V(\d+)_\d+$", 1).cast(pl.Int64, strict=False),
+            batch_id.str.extract(r"_(\d+)_V\d+_\d+$", 1).cast(pl.Int64, strict=False),
+            batch_id,
+            pl.col(ROW),
+        ],
+        descending=[True, True, False, False],
+        nulls_last=True,
+    )
+
+
+def keep_survivors(frame, keys):
+    """Drop duplicates of `keys` from a DataFrame or LazyFrame, keeping the survivor of each group in place."""
+    if "batch_id" not in frame.collect_schema().names():
+        return frame.unique(subset=keys, keep="first", maintain_order=True)
+    return (
+        survivor_order(frame.with_row_index(ROW))
+        .unique(subset=keys, keep="first", maintain_order=True)
+        .sort(ROW)
+        .drop(ROW)
+    )
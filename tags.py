@@ -0,0 +1,116 @@
+import re
+
+import polars as pl
+
+TAGS = ("abandon", "reason", "intervene")
+OPEN_TAG_PATTERN = re.compile(r"<(abandon|reason|intervene)>")
+
+
+def iter_tag_spans(text: str):
+    """
+    Split text into (kind, start, end) spans over the original string in a single pass.
+
+    kind is "text" for untagged text, otherwise the tag name, in which case start and end
+    delimit the content between the opening and closing tags. A tag that is never closed
+    runs to the end of the text. No part of the text is copied.
+    """
+    pos = 0
+    length = len(text)
+    while pos < length:
+        match = OPEN_TAG_PATTERN.search(text, pos)
+        if match is None:
+            break
+        if match.start() > pos:
+            yield ("text", pos, match.start())
+
+        kind = match.group(1)
+        content_start = match.end()
+        end_pos = text.find(f"</{kind}>", content_start)
+        if end_pos == -1:  # No closing tag found
+            yield (kind, content_start, length)
+            pos = length
+        else:
+            yield (kind, content_start, end_pos)
+            pos = end_pos + len(kind) + 3
+
+    if pos < length:
+        yield ("text", pos, length)
+
+
+# A tagged span together with the untagged text before it. Matches are leftmost-first, so the
+# spans are exactly the ones iter_tag_spans yields.
+TAG_SPAN_PATTERN = "(?s).*?(?:" + "|".join(f"<{tag}>.*?(?:</{tag}>|\\z)" for tag in TAGS) + ")"
+SPAN_PREFIX_PATTERN = "(?s)^(.*?)<(?:" + "|".join(TAGS) + ")>"
+
+TAG_SPAN_DTYPE = pl.List(
+    pl.Struct({"kind": pl.Utf8, "round": pl.UInt32, "text": pl.Utf8, "offset": pl.UInt32})
+)
+
+
+def extract_tag_spans(df: pl.DataFrame, column: str = "response", alias: str = "tag_spans") -> pl.DataFrame:
+    """
+    Extract every tagged span of a text column into a list[struct{kind, round, text, offset}] column.
+
+    `round` counts spans of the same kind within a row starting at 1 (the "Round N" anchors of
+    parse_and_render_text) and `offset` is the character position of the span's content, so
+    text[offset:offset + len(span text)] is the content. Runs as vectorized Polars expressions.
+    """
+    rows = df.lazy().select(
+        pl.int_range(pl.len(), dtype=pl.UInt32).alias("row"),
+        pl.col(column).cast(pl.Utf8).fill_null("").alias("text"),
+    )
+    spans = (
+        rows.select("row", pl.col("text").str.extract_all(TAG_SPAN_PATTERN).alias("match"))
+        .explode("match")
+        .drop_nulls("match")
+        .with_columns(
+            pl.col("match").str.extract(SPAN_PREFIX_PATTERN, 1).str.len_chars().alias("prefix_length"),
+            pl.col("match").str.len_chars().alias("match_length"),
+            pl.col("match").str.extract(f"<({'|'.join(TAGS)})>", 1).alias("kind"),
+        )
+        .with_columns(
+            # Content starts after the untagged prefix and the opening tag of the span
+            (pl.col("prefix_length") + pl.col("kind").str.len_chars() + 2).alias("content_start"),
+            (pl.col("match_length").cum_sum().over("row") - pl.col("match_length")).alias("match_start"),
+            (pl.int_range(pl.len(), dtype=pl.UInt32).over("row", "kind") + 1).alias("round"),
+        )
+        .with_columns(
+            (pl.col("match_start") + pl.col("content_start")).cast(pl.UInt32).alias("offset"),
+            pl.col("match")
+            .str.slice(pl.col("content_start"))
+            .str.strip_suffix(pl.concat_str(pl.lit("</"), pl.col("kind"), pl.lit(">")))
+            .alias("text"),
+        )
+        .group_by("row")
+        .agg(pl.struct("kind", "round", "text", "offset").alias(alias))
+    )
+    tag_spans = (
+        rows.select("row")
+        .join(spans, on="row", how="left")
+        .sort("row")
+        .select(pl.col(alias).fill_null(pl.lit([], dtype=TAG_SPAN_DTYPE)).cast(TAG_SPAN_DTYPE))
+        .collect()
+    )
+    return df.with_columns(tag_spans.get_column(alias))
+
+
+TAG_POSITION_DTYPE = pl.List(pl.Struct({"kind": pl.Utf8, "round": pl.UInt32, "offset": pl.UInt32}))
+
+
+def extract_tag_positions(df: pl.DataFrame, column: str = "response", alias: str = "tag_spans") -> pl.DataFrame:
+    """
+    Like extract_tag_spans, but keep only the kind, round and offset of every span.
+
+    Enough for counting spans and building the round anchors, without a second copy of the text.
+    """
+    positions = extract_tag_spans(df.select(column), column, alias).select(
+        pl.col(alias).list.eval(
+            pl.struct(pl.element().struct.field(field) for field in ("kind", "round", "offset"))
+        ).cast(TAG_POSITION_DTYPE)
+    )
+    return df.with_columns(positions.get_column(alias))
+
+
+def count_tag_spans(tag_spans: pl.Expr, kind: str) -> pl.Expr:
+    """Number of spans of one kind per row, e.g. the intervention rounds actually present in a response."""
+    return tag_spans.list.eval(pl.element().struct.field("kind") == kind).list.sum()
@@ -0,0 +1,53 @@
+import hashlib
+
+import polars as pl
+
+# Text columns hashed when deliveries are stored, and the prefix of their hash columns
+HASHED_COLUMNS = {
+    "user_prompt": "prompt",
+    "response": "response",
+}
+HASH_SIZE = 16
+
+
+def content_hash(text):
+    """
+    blake2b hex digest of a text; stable across runs and Polars versions, unlike Expr.hash.
+
+    Lone surrogates (e.g. from an unpaired "\\ud800" escape) are hashed as they are instead of failing.
+    """
+    if text is None:
+        return None
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=HASH_SIZE).hexdigest()
+
+
+def normalized(text: pl.Expr) -> pl.Expr:
+    """Lowercase and collapse whitespace, so texts that only differ in case or spacing hash alike."""
+    return text.str.to_lowercase().str.replace_all(r"\s+", " ").str.strip_chars()
+
+
+def hash_expr(text: pl.Expr) -> pl.Expr:
+    return text.map_batches(
+        lambda texts: pl.Series([content_hash(t) for t in texts], dtype=pl.Utf8),
+        return_dtype=pl.Utf8,
+    )
+
+
+def hash_exprs(columns=HASHED_COLUMNS) -> list:
+    """
+    "<name>_hash" (exact) and "<name>_norm_hash" (normalized) columns for every {column: name}.
+
+    Only the digests need to be kept afterwards, so duplicates can be compared without the texts.
+    """
+    exprs = []
+    for column, name in columns.items():
+        text = pl.col(column).cast(pl.Utf8)
+        exprs += [
+            hash_expr(text).alias(f"{name}_hash"),
+            hash_expr(normalized(text)).alias(f"{name}_norm_hash"),
+        ]
+    return exprs
+
+
+def hash_columns(columns=HASHED_COLUMNS) -> list:
+    return [f"{name}{suffix}" for name in columns.values() for suffix in ("_hash", "_norm_hash")]
@@ -1,6 +1,38 @@
 import streamlit as st
 import re
-from collections import defaultdict
+import threading
+from collections import OrderedDict, defaultdict
+from tags import iter_tag_spans
+from text_hash import content_hash
+
+# Patterns used by clean_text and convert_latex_to_lists, compiled once at import time
+EXAMPLE_PATTERN = re.compile(r"\\exmp\{(.*?)\}\{(.*?)\}%", flags=re.DOTALL)
+LEFTOVER_EXAMPLE_PATTERN = re.compile(r"\\exmp\{(.*?)\}\{(.*?)\}%")
+# Equivalent to replacing \\( \\) \( \) \\[ \\] one after another
+MATH_DELIMITER_PATTERN = re.compile(r"\\\\[()\[\]]|\\[()]")
+CPP_FENCE_PATTERN = re.compile(r"(?!`)``cpp")
+EPIGRAPH_PATTERN = re.compile(r"\\epigraph\{(.*?)\}\{(.*?)\}")
+QUOTE_PATTERN = re.compile(r"``(.*?)''")
+PROBLEM_HEADER_PATTERN = re.compile(r"\\begin\{problem\}.*?megabytes\}")
+GRAPHIC_PATTERN = re.compile(r"\\begin\{center\}.*\\includegraphics.*?\\end\{center\}")
+PROBLEM_END_PATTERN = re.compile(r"\\end\{problem\}")
+TEXTIT_PATTERN = re.compile(r"\\textit\{(.*?)\}")
+TEXTBF_PATTERN = re.compile(r"\\textbf\{(.*?)\}")
+EMPH_PATTERN = re.compile(r"\\emph\{(.*?)\}")
+IT_PATTERN = re.compile(r"\\it\{(.*?)\}")
+HREF_PATTERN = re.compile(r"\\href\{(.*?)\}\{(.*?)\}")
+TEXTTT_PATTERN = re.compile(r"[`']*\\t(exttt)?\{(.*?)\}[`']*")
+PROMPT_NEWLINE_PATTERN = re.compile(r"\\n(?!e )(?!eq )")
+RESPONSE_DOUBLE_NEWLINE_PATTERN = re.compile(r"\\n\\n")
+RESPONSE_NEWLINE_PATTERN = re.compile(r"\\n(?!e )(?!eq )(?!\\n)(?!ot )")
+TAB_PATTERN = re.compile(r"\\t(?!imes)(?!ext)(?!o)(?!au)(?!heta)")
+LIST_LINE_PATTERN = re.compile(r"\\(?:(begin)\s?\{(enumerate|itemize)\}|(end)\s?\{(?:enumerate|itemize)\}|item)")
+LIST_CONTINUATION_STOP_PATTERN = re.compile(r"\s*\\item|\s*\\begin|\s*\\end")
+
+# Rendered text is cached per (content hash, category), so reruns and revisited cases are lookups
+RENDER_CACHE_SIZE = 256
+_render_cache = OrderedDict()
+_render_cache_lock = threading.Lock()
 
 
 def format_examples(text, add_flag=False):
@@ -12,7 +44,7 @@ def format_examples(text, add_flag=False):
         )
 
     # Replace each example in-place
-    return re.sub(r"\\exmp\{(.*?)\}\{(.*?)\}%", replacement, text, flags=re.DOTALL)
+    return EXAMPLE_PATTERN.sub(replacement, text)
 
 
 def parse_and_render_text(text: str) -> None:
@@ -20,56 +52,22 @@ def parse_and_render_text(text: str) -> None:
     tokens = {"abandon": st.error, "reason": st.info, "intervene": st.warning}
     token_count = {token: 1 for token in tokens}
 
-    # Process the text to find and display chunks
-    remaining_text = text
-    while any(f"<{token}>" in remaining_text for token in tokens):
-        # Find the first occurrence of any token
-        token_positions = {token: remaining_text.find(f"<{token}>") for token in tokens}
-        token_positions = {
-            token: pos for token, pos in token_positions.items() if pos != -1
-        }
-
-        if not token_positions:
-            break
-
-        # Find which token comes first
-        current_token = min(token_positions, key=token_positions.get)
-        start_pos = token_positions[current_token]
-
-        # Display text before the token
-        if start_pos > 0:
-            st.write(remaining_text[:start_pos], unsafe_allow_html=True)
-
-        # Find the end of this token section
-        token_start = start_pos + len(f"<{current_token}>")
-        end_tag = f"</{current_token}>"
-        end_pos = remaining_text.find(end_tag, token_start)
-
-        if end_pos == -1:  # No closing tag found
-            # Display the token name and rest of text
-            st.subheader("", anchor=f"Round {token_count[current_token]}")
-            tokens[current_token](
-                f"**{current_token.upper()} {token_count[current_token]}:** {remaining_text[token_start:]}"
-            )
-            token_count[current_token] += 1
-            remaining_text = ""
-        else:
-            # Display the content with the appropriate component
-            st.subheader("", anchor=f"Round {token_count[current_token]}")
-            token_content = remaining_text[token_start:end_pos]
-            tokens[current_token](
-                f"**{current_token.upper()} {token_count[current_token]}:** {token_content}"
-            )
-            token_count[current_token] += 1
-            # Update remaining text
-            remaining_text = remaining_text[end_pos + len(end_tag) :]
+    for kind, start, end in iter_tag_spans(text):
+        if kind == "text":
+            st.write(text[start:end], unsafe_allow_html=True)
+            continue
 
-    # Display any remaining text
-    if remaining_text:
-        st.write(remaining_text, unsafe_allow_html=True)
+        # Display the content with the appropriate component
+        st.subheader("", anchor=f"Round {token_count[kind]}")
+        tokens[kind](f"**{kind.upper()} {token_count[kind]}:** {text[start:end]}")
+        token_count[kind] += 1
 
 
 def convert_latex_to_lists(text):
+    # Nothing to convert, every line would be kept as is
+    if "\\item" not in text and "\\begin" not in text and "\\end" not in text:
+        return text
+
     # Track nesting level and list types
     level = 0
     list_stack = []  # Stack to track if current level is enumerate or itemize
@@ -85,11 +83,11 @@ def convert_latex_to_lists(text):
     while i < len(lines):
         line = lines[i].strip()
         original_line = lines[i]  # Keep original line with whitespace
+        match = LIST_LINE_PATTERN.match(line)
 
         # Check for begin enumerate or itemize
-        if re.match(r"\\begin\s?\{(enumerate|itemize)\}", line):
-            match = re.match(r"\\begin\s?\{(enumerate|itemize)\}", line)
-            list_type = match.group(1)
+        if match and match.group(1):
+            list_type = match.group(2)
 
             level += 1
             list_stack.append(list_type)
@@ -103,7 +101,7 @@ def convert_latex_to_lists(text):
             continue
 
         # Check for end enumerate or itemize
-        elif re.match(r"\\end\s?\{(enumerate|itemize)\}", line):
+        elif match and match.group(3):
             # Reset counter for this level if it was enumerate
             if list_stack and list_stack[-1] == "enumerate":
                 counters[level] = 0
@@ -117,16 +115,13 @@ def convert_latex_to_lists(text):
             continue
 
         # Check for item
-        elif re.match(r"\\item", line):
+        elif match:
             # Determine current list type
             current_list_type = list_stack[-1] if list_stack else "enumerate"
 
             # Extract the content after \item
             item_content = line[5:].strip()
 
-            # Preserve leading whitespace from the original line
-            leading_space = re.match(r"^(\s*)", original_line).group(1)
-
             # Add appropriate indentation based on nesting level
             indent = "    " * (level - 1)
 
@@ -134,9 +129,7 @@ def convert_latex_to_lists(text):
             j = i + 1
             additional_content = []
 
-            while j < len(lines) and not (
-                re.match(r"\s*\\item|\s*\\begin|\s*\\end", lines[j])
-            ):
+            while j < len(lines) and not LIST_CONTINUATION_STOP_PATTERN.match(lines[j]):
                 additional_content.append(lines[j])
                 j += 1
 
@@ -169,64 +162,83 @@ def convert_latex_to_lists(text):
     return "\n".join(result)
 
 
-def clean_text(text: str, category: str) -> str:
+def render_text(text: str, category: str) -> str:
+    """Uncached clean_text pipeline."""
     # Turns inline and block math into katex-compatible
     # text = text.encode("utf-8").decode("unicode_escape")  # This was breaking \begin, \end, etc.
 
-    text = text.replace("\\\\(", "$")
-    text = text.replace("\\\\)", "$")
-    text = text.replace("\\(", "$")
-    text = text.replace("\\)", "$")
-    text = text.replace("\\\\[", "$")
-    text = text.replace("\\\\]", "$")
+    # Every rewrite except the two quote fixes below needs a backslash, so plain text skips them
+    has_backslash = "\\" in text
+
+    if has_backslash:
+        text = MATH_DELIMITER_PATTERN.sub("$", text)
+
+        # Fixes some weird custom expressions
+        text = text.replace("\\InputFile", "")
+        text = text.replace("\\OutputFile", "")
+        text = text.replace("\\Note", "")
 
-    # Fixes some weird custom expressions
-    text = text.replace("\\InputFile", "")
-    text = text.replace("\\OutputFile", "")
-    text = text.replace("\\Note", "")
+    text = CPP_FENCE_PATTERN.sub("```cpp", text)  # Fixes batch 4, 59955
 
-    text = re.sub(r"(?!`)``cpp", "```cpp", text)  # Fixes batch 4, 59955
+    if has_backslash:
+        text = EPIGRAPH_PATTERN.sub(
+            lambda match: f"*(The original problem included an epigraph, that said '{match.group(1)} {match.group(2)}')*",
+            text,
+        )
+    text = QUOTE_PATTERN.sub(r"`\1`", text)
 
-    text = re.sub(
-        r"\\epigraph\{(.*?)\}\{(.*?)\}",
-        lambda match: f"*(The original problem included an epigraph, that said '{match.group(1)} {match.group(2)}')*",
-        text,
-    )
-    text = re.sub(r"``(.*?)''", r"`\1`", text)
+    if not has_backslash:
+        return text
 
     # Find all examples and display them as tables
     text = format_examples(text, add_flag=category != "response")
 
     # Fixes some custom tags
-    text = re.sub(r"\\exmp\{(.*?)\}\{(.*?)\}%", "", text)
-    text = re.sub(r"\\begin\{problem\}.*?megabytes\}", "", text)
-    text = re.sub(
-        r"\\begin\{center\}.*\\includegraphics.*?\\end\{center\}",
-        "*(A graphic is shown here in the original problem.)*",
-        text,
-    )
-    text = re.sub(r"\\end\{problem\}", "", text)
+    text = LEFTOVER_EXAMPLE_PATTERN.sub("", text)
+    text = PROBLEM_HEADER_PATTERN.sub("", text)
+    text = GRAPHIC_PATTERN.sub("*(A graphic is shown here in the original problem.)*", text)
+    text = PROBLEM_END_PATTERN.sub("", text)
 
     # Fixes some leftover styling tags
-    text = re.sub(r"\\textit\{(.*?)\}", r"*\1*", text)
-    text = re.sub(r"\\textbf\{(.*?)\}", r"**\1**", text)
-    text = re.sub(r"\\emph\{(.*?)\}", r"*\1*", text)
-    text = re.sub(r"\\it\{(.*?)\}", r"*\1*", text)
+    text = TEXTIT_PATTERN.sub(r"*\1*", text)
+    text = TEXTBF_PATTERN.sub(r"**\1**", text)
+    text = EMPH_PATTERN.sub(r"*\1*", text)
+    text = IT_PATTERN.sub(r"*\1*", text)
 
     # Fixes href tags
-    text = re.sub(r"\\href\{(.*?)\}\{(.*?)\}", r"[\2](\1)", text)
+    text = HREF_PATTERN.sub(r"[\2](\1)", text)
 
     # Fixes \texttt
-    text = re.sub(r"[`']*\\t(exttt)?\{(.*?)\}[`']*", r"`\2`", text)
+    text = TEXTTT_PATTERN.sub(r"`\2`", text)
 
     if category != "response":
-        text = re.sub(r"\\n(?!e )(?!eq )", "\n", text)
+        text = PROMPT_NEWLINE_PATTERN.sub("\n", text)
     else:
-        text = re.sub(r"\\n\\n", "\n", text)
-        text = re.sub(r"\\n(?!e )(?!eq )(?!\\n)(?!ot )", "  \n", text)
+        text = RESPONSE_DOUBLE_NEWLINE_PATTERN.sub("\n", text)
+        text = RESPONSE_NEWLINE_PATTERN.sub("  \n", text)
 
-    text = re.sub(r"\\t(?!imes)(?!ext)(?!o)(?!au)(?!heta)", r"\t", text)
+    text = TAB_PATTERN.sub(r"\t", text)
     text = text.replace("\\begin{example}", "")
     text = text.replace("\\end{example}", "")
     text = convert_latex_to_lists(text)
     return text
+
+
+def clean_text(text: str, category: str, prerendered: dict = None) -> str:
+    """Render text as markdown. `prerendered` is an optional lookup produced by prerender.py."""
+    key = (content_hash(text), category)
+    if prerendered and key in prerendered:
+        return prerendered[key]
+
+    with _render_cache_lock:
+        if key in _render_cache:
+            _render_cache.move_to_end(key)
+            return _render_cache[key]
+
+    rendered = render_text(text, category)
+
+    with _render_cache_lock:
+        _render_cache[key] = rendered
+        if len(_render_cache) > RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+    return rendered
@@ -7,20 +7,64 @@ from dotenv import load_dotenv
 from streamlit_scroll_navigation import scroll_navbar
 from utils import parse_and_render_text, clean_text
 from constants import DATA_VALS, DATA_INFO, SCROLLBAR_STYLES, FILTER_OPTIONS
+from dataset import TAG_POSITIONS, build_arrow_cache, dataset_options, open_out_of_core, read_upload, upload_fingerprint
+from filters import build_position_index, compile_filter_expr, filter_state_key, get_filter_state, step_position
+from prerender import read_prerendered, sidecar_path
+from search_index import build_search_index, make_snippet, search
+from stats import COUNT_STATS, case_breakdowns, case_stats
+from tags import TAG_POSITION_DTYPE, count_tag_spans, extract_tag_positions
 
 load_dotenv(override=True)
 DATA_DIR = os.getenv("DATA_DIR", "./data")
+# Keep text columns in a memory-mapped cache under DATA_DIR instead of in each session's memory
+OUT_OF_CORE = os.getenv("OUT_OF_CORE", "false").lower() in ("1", "true", "yes")
 
 # df = pl.read_json(os.path.join(DATA_DIR, "evaluations.json"))
 
 st.set_page_config(layout="wide", page_title="CoT Viewer", page_icon="👀")
 
-@st.cache_data
-def read_file(file_path: str, file_type: str) -> pl.DataFrame:
-    if file_type == "application/json":
-        return pl.read_json(file_path)
-    elif file_type == "text/csv":
-        return pl.read_csv(file_path)
+@st.cache_resource(max_entries=8)
+def load_prerendered(paths: tuple, mtimes: tuple) -> dict:
+    # mtimes are part of the cache key so regenerated sidecars are picked up
+    return read_prerendered(paths)
+
+def get_prerendered(evaluation_files) -> dict:
+    """Pre-rendered markdown from `python prerender.py`, looked up in DATA_DIR/rendered by uploaded file name."""
+    paths = [sidecar_path(os.path.join(DATA_DIR, "rendered"), f.name) for f in evaluation_files]
+    paths = tuple(path for path in paths if os.path.exists(path))
+    if not paths:
+        return {}
+    return load_prerendered(paths, tuple(os.path.getmtime(path) for path in paths))
+
+# Shared by all sessions and keyed by the upload fingerprint, so reviewers opening the same files share one copy.
+# Arguments starting with an underscore are not hashed by Streamlit.
+@st.cache_resource(max_entries=4)
+def load_dataset(fingerprint: str, _evaluation_files) -> dict:
+    """The concatenated uploads and everything derived from them that does not depend on the session."""
+    if OUT_OF_CORE:
+        # df only holds ids, filter columns, text lengths and tag positions; text is fetched from text_df on demand
+        cache_path = build_arrow_cache(_evaluation_files, os.path.join(DATA_DIR, ".viewer_cache"), fingerprint)
+        df, text_df = open_out_of_core(cache_path)
+        text_source = pl.scan_ipc(cache_path, memory_map=True)
+    else:
+        df = pl.concat([read_upload(evaluation_file) for evaluation_file in _evaluation_files], how="diagonal")
+        text_df = df
+        text_source = df.lazy()
+    return {"df": df, "text_df": text_df, "text_source": text_source, **dataset_options(df)}
+
+@st.cache_resource(max_entries=4)
+def load_search_index(fingerprint: str, _text_source: pl.LazyFrame) -> pl.DataFrame:
+    return build_search_index(_text_source)
+
+@st.cache_resource(max_entries=4)
+def load_tag_spans(fingerprint: str, _df: pl.DataFrame, _text_df: pl.DataFrame) -> pl.Series:
+    """Kind, round and offset of the tagged spans of every response, extracted once per dataset."""
+    if TAG_POSITIONS in _df.columns:
+        # Stored in the Arrow cache in out-of-core mode
+        return _df.get_column(TAG_POSITIONS)
+    if "response" in _text_df.columns:
+        return extract_tag_positions(_text_df.select("response")).get_column("tag_spans")
+    return pl.Series("tag_spans", [[]] * len(_text_df), dtype=TAG_POSITION_DTYPE)
 
 def search_by_question_id():
     search_term = st.session_state.get("question_id_search", "")
@@ -58,98 +102,61 @@ def search_evaluation():
     else:
         st.session_state["search_none"] = True
 
+def get_filtered_view():
+    """
+    Return the filtered dataframe together with the sorted row positions of the matches in the
+    full dataframe and the reverse position index. Recomputed only when the data or filters change.
+    """
+    df = st.session_state["df"]
+    highest_intervention_round = st.session_state.get("highest_intervention_round", df.get_column("intervention rounds").max())
+    filter_state = get_filter_state(st.session_state, highest_intervention_round)
+    cache_key = (st.session_state.get("dataset_key"), filter_state_key(filter_state))
+
+    cached = st.session_state.get("filtered_cache")
+    if cached is not None and cached[0] == cache_key:
+        return cached[1]
+
+    filtered_df = df.lazy().with_row_index("row_position").filter(compile_filter_expr(filter_state)).collect()
+    positions = filtered_df.get_column("row_position").to_list()
+    view = (filtered_df.drop("row_position"), positions, build_position_index(positions))
+    st.session_state["filtered_cache"] = (cache_key, view)
+    return view
+
 def fetch_filtered_df():
-    filtered_df = st.session_state["df"]
-    highest_intervention_round = filtered_df.get_column("intervention rounds").max()
-    abandon_choices = st.session_state.get("abandon_choices", [])
-    classification_choices = st.session_state.get("classification_choices", [])
-    trainer_choices = st.session_state.get("trainer_choices", [])
-    acc_choices = st.session_state.get("acc_choices", [])
-    intervention_slider_filter = st.session_state.get("intervention_slider_filter", (0, highest_intervention_round))
-    model_choices = st.session_state.get("model_choices", [])
-
-    if st.session_state.get("abandon_filter") == "Abandoned":
-        filtered_df = filtered_df.filter(pl.col("abandon_prompt") == "Yes")
-    elif st.session_state.get("abandon_filter") == "Not abandoned":
-        filtered_df = filtered_df.filter(pl.col("abandon_prompt") != "Yes")
-    if st.session_state.get("intervention_filter") == "Has interventions":
-        filtered_df = filtered_df.filter(pl.col("intervention rounds") > 0)
-    elif st.session_state.get("intervention_filter") == "No interventions":
-        filtered_df = filtered_df.filter(pl.col("intervention rounds") == 0)
-    if st.session_state.get("ground_truth_solutions_filter") == "Has ground truth":
-        filtered_df = filtered_df.filter(pl.col("ground_truth_answer").is_not_null())
-    elif st.session_state.get("ground_truth_solutions_filter") == "No ground truth":
-        filtered_df = filtered_df.filter(pl.col("ground_truth_answer").is_null())
-
-    if len(model_choices) > 0:
-        filtered_df = filtered_df.filter(pl.col("model name").is_in(model_choices))
-    if len(abandon_choices) > 0:
-        filtered_df = filtered_df.filter(pl.col("abandon_prompt_reason").is_in(abandon_choices))
-    if len(classification_choices) > 0:
-        filtered_df = filtered_df.filter(pl.col("Model performance classification").is_in(classification_choices))
-    if len(acc_choices) > 0:
-        filtered_df = filtered_df.filter(pl.col("ACC").cast(pl.Float64, strict=False).is_in(acc_choices))
-    if len(trainer_choices) > 0:
-        filtered_df = filtered_df.filter(pl.col("trainer id").is_in(trainer_choices))
-    if intervention_slider_filter is not None:
-        filtered_df = filtered_df.filter(pl.col("intervention rounds").cast(pl.Int32, strict=False).is_between(intervention_slider_filter[0], intervention_slider_filter[1]))
-    return filtered_df
-
-def get_filtered_indices():
-    """Get the indices from the original dataframe that match the current filters."""
-    filtered_df = fetch_filtered_df()
-    # Get task IDs from filtered df
-    filtered_task_ids = filtered_df.get_column("task id").to_list()
-    # Get indices from original df where task ID matches filtered task IDs
-    original_indices = st.session_state["df"].with_row_index("index").filter(
-        pl.col("task id").is_in(filtered_task_ids)
-    ).get_column("index").to_list()
-    return original_indices
+    return get_filtered_view()[0]
 
-def previous_evaluation():
-    filtered_indices = get_filtered_indices()
-    if not filtered_indices:
+def step_evaluation(step):
+    _, positions, position_index = get_filtered_view()
+    new_index = step_position(positions, position_index, st.session_state["current_index"], step)
+    if new_index is None:
         return
-        
-    # Find the current position in filtered indices
-    try:
-        current_pos = filtered_indices.index(st.session_state["current_index"])
-        # Move to previous position in filtered indices
-        if current_pos > 0:
-            st.session_state["current_index"] = filtered_indices[current_pos - 1]
-        else:
-            st.session_state["current_index"] = filtered_indices[-1]
-    except ValueError:
-        # If current index not in filtered set, move to last filtered index
-        st.session_state["current_index"] = filtered_indices[-1]
-    
-    df_slice = st.session_state["df"].slice(st.session_state["current_index"], 1)
+    st.session_state["current_index"] = new_index
 
     # Update search with task ID from original dataframe
+    df_slice = st.session_state["df"].slice(new_index, 1)
     st.session_state["search"] = str(df_slice.get_column("task id").item())
     st.session_state["question_id_search"] = str(df_slice.get_column("question_id").item())
 
+def previous_evaluation():
+    step_evaluation(-1)
+
 def next_evaluation():
-    filtered_indices = get_filtered_indices()
-    if not filtered_indices:
-        return
-        
-    # Find the current position in filtered indices
-    try:
-        current_pos = filtered_indices.index(st.session_state["current_index"])
-        # Move to next position in filtered indices
-        if current_pos < len(filtered_indices) - 1:
-            st.session_state["current_index"] = filtered_indices[current_pos + 1]
-        else:
-            st.session_state["current_index"] = filtered_indices[0]
-    except ValueError:
-        # If current index not in filtered set, move to first filtered index
-        st.session_state["current_index"] = filtered_indices[0]
-    
-    # Update search with task ID from original dataframe
-    df_slice = st.session_state["df"].slice(st.session_state["current_index"], 1)
-    st.session_state["search"] = str(df_slice.get_column("task id").item())
-    st.session_state["question_id_search"] = str(df_slice.get_column("question_id").item())
+    step_evaluation(1)
+
+@st.cache_resource(max_entries=4)
+def load_case_stats(fingerprint: str, _df: pl.DataFrame, _tag_spans: pl.Series):
+    """All Cases statistics, their breakdowns and the intervention round mismatches, computed once per dataset."""
+    round_mismatches = _df.select(
+        (count_tag_spans(pl.lit(_tag_spans), "intervene") != pl.col("intervention rounds").cast(pl.Int64, strict=False)).sum()
+    ).item()
+    return case_stats(_df), case_breakdowns(_df), round_mismatches
+
+def get_search_index():
+    """Full-text search index of the loaded dataset, built on first search."""
+    return load_search_index(st.session_state["dataset_key"], st.session_state["text_source"])
+
+def get_tag_spans():
+    return load_tag_spans(st.session_state["dataset_key"], st.session_state["df"], st.session_state["text_df"])
 
 @st.dialog("Search Results")
 def search_for_string():
@@ -157,41 +164,35 @@ def search_for_string():
     if not search_term:
         return
     
-    df = st.session_state["df"]
-
-    matches = df.filter(pl.col("user prompt").str.contains_any([search_term], ascii_case_insensitive=True) | pl.col("response").str.contains_any([search_term], ascii_case_insensitive=True))
-    if matches.shape[0] > 0:
-        st.write(f"There are {matches.shape[0]} matches for '{search_term}'")
-        for i in range(matches.shape[0]):
-            task_id = matches.get_column('task id').item(i)
-            question_id = matches.get_column('question_id').item(i)
-            prompt_item = matches.get_column('user prompt').item(i)
-            response_item = matches.get_column('response').item(i)
-
-            if st.button(f"Task {task_id}"):
+    df = st.session_state["text_df"]
+
+    # Start from the first page whenever the query changes
+    if st.session_state.get("search_page_query") != search_term:
+        st.session_state["search_page_query"] = search_term
+        st.session_state["search_page"] = 1
+
+    page_size = 20
+    page = st.session_state["search_page"]
+    total, hits = search(get_search_index(), df, search_term, page=page - 1, page_size=page_size)
+    if total > 0:
+        st.write(f"There are {total} matches for '{search_term}'")
+        if total > page_size:
+            st.number_input("Page", min_value=1, max_value=(total - 1) // page_size + 1, key="search_page")
+        for hit in hits:
+            row = hit["row"]
+            task_id = df.get_column('task id').item(row)
+            question_id = df.get_column('question_id').item(row)
+
+            if st.button(f"Task {task_id}", key=f"search_hit_{row}"):
+                st.session_state["current_index"] = row
                 st.session_state["search"] = str(task_id)
                 st.session_state["question_id_search"] = str(question_id)
-                search_evaluation()
                 st.rerun()
 
-            if search_term.lower() in prompt_item.lower():
-                idx = prompt_item.lower().index(search_term.lower())
-                prefix = "**Prompt:** "
-                if idx > 50 and len(prompt_item) - idx > 50:
-                    st.write(f"{prefix}...{prompt_item[idx-50:idx+50]}...")
-                elif idx <= 50:
-                    st.write(f"{prefix}{prompt_item[:100]}...")
-                else:
-                    st.write(f"{prefix}...{prompt_item[-100:]}")
-            if search_term.lower() in response_item.lower():
-                idx = response_item.lower().index(search_term.lower())
-                prefix = "**Response:** "
-                if idx > 50 and len(response_item) - idx > 50:
-                    st.write(f"{prefix}...{response_item[idx-50:idx+50]}...")
-                elif idx <= 50:
-                    st.write(f"{prefix}{response_item[:100]}...")
-                else:
-                    st.write(f"{prefix}...{response_item[-100:]}")
+            for column, prefix in [("user prompt", "**Prompt:** "), ("response", "**Response:** ")]:
+                offsets = hit["offsets"].get(column)
+                if offsets is not None:
+                    st.write(f"{prefix}{make_snippet(df.get_column(column).item(row), offsets)}")
             st.divider()
     else:
         st.write(f"No matches found for '{search_term}'")
@@ -227,30 +228,28 @@ current_index = st.session_state.get("current_index", 0)
 
 evaluation_files = st.file_uploader("Upload evaluations file", type=["json", "csv"], accept_multiple_files=True)
 if evaluation_files and len(evaluation_files) > 0:
-    df = pl.concat([read_file(evaluation_file, evaluation_file.type) for evaluation_file in evaluation_files], how="diagonal")
+    # Identifies the uploaded data, so memoized results are dropped when the upload changes
+    dataset_key = upload_fingerprint(evaluation_files)
+    dataset = load_dataset(dataset_key, evaluation_files)
+    df = dataset["df"]
+    text_df = dataset["text_df"]
 
-    curr_df = df.slice(current_index, 1)
+    curr_df = text_df.slice(current_index, 1)
 
-    highest_intervention_round = df.get_column("intervention rounds").max()
+    highest_intervention_round = dataset["highest_intervention_round"]
 
     st.session_state["df"] = df
+    st.session_state["text_df"] = text_df
+    st.session_state["text_source"] = dataset["text_source"]
     st.session_state["curr_df"] = curr_df
+    st.session_state["highest_intervention_round"] = highest_intervention_round
+    st.session_state["dataset_key"] = dataset_key
+
+    tag_spans = get_tag_spans()
+    curr_spans = tag_spans.item(current_index).to_list()
 
-    abandon_options = df.get_column("abandon_prompt_reason").unique().to_list()
-    classification_options = df.get_column("Model performance classification").unique().to_list()
-    acc_options = []
-    if "ACC" in df.columns:
-        acc_options = df.get_column("ACC").cast(pl.Float64, strict=False).unique().to_list()
-    if "trainer id" in df.columns:
-        trainer_options = df.get_column("trainer id").unique().to_list()
-    if "model name" in df.columns:
-        model_options = df.get_column("model name").unique().to_list()
-
-    st.session_state["abandon_options"] = abandon_options
-    st.session_state["classification_options"] = classification_options
-    st.session_state["acc_options"] = acc_options
-    st.session_state["trainer_options"] = trainer_options
-    st.session_state["model_options"] = model_options
+    for key in ["abandon_options", "classification_options", "acc_options", "trainer_options", "model_options"]:
+        st.session_state[key] = dataset[key]
 
     with st.sidebar:
         st.text_input("Search by task ID", key="search", on_change=search_evaluation, placeholder="e.g. 60000")
@@ -277,7 +276,7 @@ if evaluation_files and len(evaluation_files) > 0:
             filtered_rows = len(filtered_df)
             st.text(f"Showing {filtered_rows} of {total_rows} rows")
         
-        st.text_input("Search in prompt and response", key="search_string", on_change=search_for_string)
+        st.text_input("Search in prompt and response", key="search_string", on_change=search_for_string, help='All words must match; use quotes for exact phrases, e.g. "dynamic programming"')
 
         # Use current values from session state as defaults
         # st.selectbox(
@@ -350,11 +349,13 @@ if evaluation_files and len(evaluation_files) > 0:
             ],
             override_styles=SCROLLBAR_STYLES
         )
-        if curr_df.get_column("intervention rounds").item() > 0:
+        # Anchors come from the tags actually present in the response, not the reported count
+        highest_round = max((span["round"] for span in curr_spans), default=0)
+        if highest_round > 0:
             st.subheader("Intervention Rounds")
             scroll_navbar(
                 key="intervention_rounds",
-                anchor_ids=list(map(lambda x: f"Round {x}", range(1, curr_df["intervention rounds"].item() + 1))),
+                anchor_ids=list(map(lambda x: f"Round {x}", range(1, highest_round + 1))),
                 override_styles=SCROLLBAR_STYLES
             )
     
@@ -364,28 +365,25 @@ if evaluation_files and len(evaluation_files) > 0:
     # Data info
     st.header("Data Info", anchor="Data Info")
     st.subheader("All Cases")
-    stats = pl.DataFrame({
-        "total": len(df),
-        "abandoned": df.filter(pl.col("abandon_prompt") == "Yes").shape[0],
-        "zero_interventions": df.filter(pl.col("intervention rounds") == 0).shape[0],
-        "effective": len(df) - df.filter(pl.col("abandon_prompt_reason").is_not_null()).shape[0] - df.filter(pl.col("intervention rounds") == 0).shape[0],
-        "abandoned_and_no_interventions": df.filter((pl.col("abandon_prompt") == "Yes") & (pl.col("intervention rounds") == 0)).shape[0],
-    })
+    stats, breakdowns, round_mismatches = load_case_stats(dataset_key, df, get_tag_spans())
     
-    if stats["abandoned_and_no_interventions"].item() > 0:
-        st.error(f"Sanity check failed: There are {stats['abandoned_and_no_interventions'].item()} cases where the case was abandoned and no interventions were made.")
+    if stats["abandoned_and_no_interventions"] > 0:
+        st.error(f"Sanity check failed: There are {stats['abandoned_and_no_interventions']} cases where the case was abandoned and no interventions were made.")
+
+    if round_mismatches > 0:
+        st.warning(f"Consistency check: {round_mismatches} cases have an `intervention rounds` value that differs from the number of <intervene> tags in the response.")
     
-    # Only calculate correlations if ACC column exists
-    calcs = {}
-    if "ACC" in df.columns:
-        calcs["correlation"] = df.filter(pl.col("ACC").is_not_null()).select(pl.corr(pl.col("intervention rounds"), pl.col("ACC"), method="pearson")).item()
-        calcs["correlation w/o ACC = 0"] = df.filter((pl.col("ACC").cast(pl.Float64, strict=False).is_not_null()) & (pl.col("ACC").cast(pl.Float64, strict=False) > 0)).select(pl.corr(pl.col("intervention rounds"), pl.col("ACC"), method="pearson")).item()
-        calcs_df = pl.DataFrame({"stat": list(calcs.keys()), "value": list(calcs.values())})
+    # Correlations are only calculated if the deliveries have ACC values
+    if "ACC" in df.columns and df.get_column("ACC").null_count() < len(df):
+        calcs_df = pl.DataFrame({"stat": ["correlation", "correlation w/o ACC = 0"], "value": [stats["correlation"], stats["correlation w/o ACC = 0"]]})
     else:
         calcs_df = pl.DataFrame({"stat": ["Note"], "value": ["ACC column not present in data"]})
 
-    st.table(stats.unpivot(variable_name="category", value_name="count"))
+    st.table(pl.DataFrame({key: stats[key] for key in COUNT_STATS}).unpivot(variable_name="category", value_name="count"))
     st.table(calcs_df)
+    for column, breakdown in breakdowns.items():
+        with st.expander(f"By {column}"):
+            st.dataframe(breakdown, hide_index=True)
 
     st.subheader("Current Case")
     data_info = {}
@@ -393,6 +391,10 @@ if evaluation_files and len(evaluation_files) > 0:
         if key in curr_df.columns:
             data_info[key] = curr_df.get_column(key).item()
     st.table(data_info)
+    intervene_tags = sum(span["kind"] == "intervene" for span in curr_spans)
+    reported_rounds = curr_df.select(pl.col("intervention rounds").cast(pl.Int64, strict=False)).item()
+    if intervene_tags != reported_rounds:
+        st.warning(f"This case reports {reported_rounds} intervention rounds, but the response has {intervene_tags} <intervene> tags.")
 
     # Remarks
     st.header("Remarks", anchor="Remarks")
@@ -400,6 +402,7 @@ if evaluation_files and len(evaluation_files) > 0:
     remarks_dict = ast.literal_eval(remarks)
     st.table(remarks_dict["remarks"])
 
+    prerendered = get_prerendered(evaluation_files)
     for (name, title) in DATA_VALS.items():
         if name not in curr_df.columns:
             continue
@@ -408,7 +411,7 @@ if evaluation_files and len(evaluation_files) > 0:
         if not val:
             st.write("No value")
             continue
-        val = clean_text(val, name)
+        val = clean_text(val, name, prerendered)
         if name != "final_answer" and name != "ground_truth_answer":
             val = val.replace("\n", "\n\n")
         if name == "ground_truth_answer":